@@ -0,0 +1,199 @@
+"""
+Benchmarks PRBSketch on synthetic power-law edge streams.
+
+Every point of the width x depth x conflict_limit grid runs in a fresh
+process, so its peak RSS is its own. For each point the harness records:
+
+- init_seconds: time to construct the sketch,
+- update_edges_per_sec: update_batch throughput over the whole stream,
+- query_us_p50/p90/p99: latency of single edge_query calls,
+- query_many_per_sec: edge_query_many throughput on the same queries,
+- sketch_bytes and peak_rss_mb.
+
+Results are written as JSON. Passing --compare with an earlier result file
+prints the change of every metric for the grid points both runs share and
+exits with status 1 when any of them regressed by more than --tolerance.
+
+    python benchmarks/bench_sketch.py --edges 2000000 --widths 512 1024 \\
+        --depths 3 4 --output bench.json --compare baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from multiprocessing import get_context
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server'))
+from prb_sketch import PRBSketch
+from streams import power_law_stream, query_mix
+
+# Metric name -> True when higher is better
+METRICS = {
+    'init_seconds': False,
+    'update_edges_per_sec': True,
+    'query_us_p50': False,
+    'query_us_p90': False,
+    'query_us_p99': False,
+    'query_many_per_sec': True,
+    'sketch_bytes': False,
+    'peak_rss_mb': False,
+}
+
+# Parameters that identify a grid point across runs
+POINT_KEYS = ('width', 'depth', 'conflict_limit', 'storage', 'hash_family', 'kernel', 'edges', 'nodes', 'alpha')
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_point(point, batch_size, queries, repeat, seed):
+    """Benchmark one grid point; meant to run in its own process."""
+    sources, dests = power_law_stream(point['edges'], point['nodes'], point['alpha'], seed)
+    qs, qd = query_mix(sources, dests, queries, point['nodes'], seed=seed + 1)
+    params = {
+        'width': point['width'],
+        'depth': point['depth'],
+        'conflict_limit': point['conflict_limit'],
+        'storage': point['storage'],
+        'hash_family': point['hash_family'],
+        'kernel': point['kernel'],
+    }
+
+    # Timings keep the best of `repeat` runs, each on a fresh sketch
+    init_seconds = update_seconds = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        sketch = PRBSketch(**params)
+        init_seconds = min(init_seconds, time.perf_counter() - start)
+        start = time.perf_counter()
+        for lo in range(0, len(sources), batch_size):
+            sketch.update_batch(sources[lo:lo + batch_size], dests[lo:lo + batch_size])
+        update_seconds = min(update_seconds, time.perf_counter() - start)
+
+    latencies = np.empty(len(qs))
+    for i, (s, d) in enumerate(zip(qs.tolist(), qd.tolist())):
+        start = time.perf_counter()
+        sketch.edge_query(s, d)
+        latencies[i] = time.perf_counter() - start
+    many_seconds = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        sketch.edge_query_many(qs, qd)
+        many_seconds = min(many_seconds, time.perf_counter() - start)
+
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1e6
+    return dict(point, **{
+        # 'auto' resolved to the kernel that actually ran
+        'kernel': sketch.kernel,
+        'init_seconds': init_seconds,
+        'update_edges_per_sec': len(sources) / update_seconds,
+        'query_us_p50': p50,
+        'query_us_p90': p90,
+        'query_us_p99': p99,
+        'query_many_per_sec': len(qs) / many_seconds,
+        'sketch_bytes': sketch.nbytes,
+        'peak_rss_mb': _peak_rss_mb(),
+    })
+
+
+def point_key(result):
+    # Runs from before the kernel option all took the NumPy path
+    return tuple(result.get(key, 'numpy') if key == 'kernel' else result[key] for key in POINT_KEYS)
+
+
+def compare(results, baseline, tolerance):
+    """Print metric changes against a baseline run; returns the regressions."""
+    earlier = {point_key(r): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        old = earlier.get(point_key(result))
+        if old is None:
+            continue
+        label = 'w={width} d={depth} c={conflict_limit} {storage} {kernel}'.format(**result)
+        print(label)
+        for metric, higher_is_better in METRICS.items():
+            if metric not in old:
+                continue
+            change = result[metric] / old[metric] - 1 if old[metric] else 0.0
+            worse = -change if higher_is_better else change
+            flag = ''
+            if worse > tolerance:
+                flag = '  REGRESSION'
+                regressions.append((label, metric, change))
+            print(f"  {metric:22s} {old[metric]:14.4g} -> {result[metric]:14.4g} ({change:+.1%}){flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark PRBSketch on synthetic power-law streams.")
+    parser.add_argument('--edges', type=int, default=1_000_000)
+    parser.add_argument('--nodes', type=int, default=100_000)
+    parser.add_argument('--alpha', type=float, default=1.2, help="power-law exponent of node popularity")
+    parser.add_argument('--widths', type=int, nargs='+', default=[256, 1024])
+    parser.add_argument('--depths', type=int, nargs='+', default=[3])
+    parser.add_argument('--conflict-limits', type=int, nargs='+', default=[3])
+    parser.add_argument('--storage', nargs='+', default=['dense'], choices=['dense', 'sparse'])
+    parser.add_argument('--hash-family', default='mix64', choices=['mix64', 'md5'])
+    parser.add_argument('--kernel', default='auto', choices=['auto', 'numba', 'numpy'])
+    parser.add_argument('--batch-size', type=int, default=100_000)
+    parser.add_argument('--queries', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='bench.json')
+    parser.add_argument('--compare', help="earlier result file to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=0.10)
+    args = parser.parse_args(argv)
+
+    points = [
+        {
+            'width': width, 'depth': depth, 'conflict_limit': limit, 'storage': storage,
+            'hash_family': args.hash_family, 'kernel': args.kernel, 'edges': args.edges, 'nodes': args.nodes, 'alpha': args.alpha,
+        }
+        for width, depth, limit, storage in product(args.widths, args.depths, args.conflict_limits, args.storage)
+    ]
+    results = []
+    for point in points:
+        # A fresh interpreter per point keeps peak RSS per point
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+            result = pool.submit(run_point, point, args.batch_size, args.queries, args.repeat, args.seed).result()
+        results.append(result)
+        print(f"w={result['width']} d={result['depth']} c={result['conflict_limit']} {result['storage']} "
+              f"{result['kernel']}: "
+              f"{result['update_edges_per_sec']:,.0f} edges/s, "
+              f"query p50 {result['query_us_p50']:.1f}us p99 {result['query_us_p99']:.1f}us, "
+              f"init {result['init_seconds'] * 1e3:.1f}ms, peak RSS {result['peak_rss_mb']:.0f}MB")
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'args': vars(args),
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
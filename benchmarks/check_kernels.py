@@ -0,0 +1,103 @@
+"""
+Checks that the compiled numba update kernel and the NumPy path build
+bit-identical sketches.
+
+Every configuration of the grid sketches the same synthetic power-law
+stream twice, once per kernel, and compares the cell arrays (rank keys,
+float32 weights by bit pattern, conflict lists), the interned edges and the
+stats. The stream is fed in several batch sizes, down to single edges, so
+both in-batch and cross-batch ties and resets are covered. Prints the update
+throughput of both kernels and exits with status 1 on any difference.
+
+    python benchmarks/check_kernels.py --edges 200000 --conflict-limits 1 3 8
+"""
+import argparse
+import os
+import sys
+import time
+from itertools import product
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server'))
+from prb_sketch import PRBSketch
+from kernels import resolve_kernel
+from streams import power_law_stream
+
+
+def build(params, kernel, sources, dests, weights, batch_size):
+    sketch = PRBSketch(kernel=kernel, **params)
+    start = time.perf_counter()
+    for lo in range(0, len(sources), batch_size):
+        hi = lo + batch_size
+        sketch.update_batch(sources[lo:hi], dests[lo:hi], weights[lo:hi])
+    return sketch, time.perf_counter() - start
+
+
+def state(sketch):
+    """Every array the update rule writes, weights by bit pattern, plus the stats."""
+    st = sketch.storage
+    cells = st.occupied()
+    return {
+        'cells': cells,
+        'rank_key': st.rank_key[cells],
+        'weight': st.weight[cells].view(np.uint32),
+        'slots': st.slots[cells],
+        'edges': sketch.edges.keys(),
+        'stats': np.array([sketch._occupied, sketch._stored_edges]),
+        'total_weight': np.array([sketch._total_weight]).view(np.uint64),
+    }
+
+
+def differences(a, b):
+    left, right = state(a), state(b)
+    return [name for name in left
+            if left[name].shape != right[name].shape or not np.array_equal(left[name], right[name])]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the numba and NumPy update kernels.")
+    parser.add_argument('--edges', type=int, default=200_000)
+    parser.add_argument('--nodes', type=int, default=20_000)
+    parser.add_argument('--alpha', type=float, default=1.2)
+    parser.add_argument('--widths', type=int, nargs='+', default=[16, 256])
+    parser.add_argument('--depths', type=int, nargs='+', default=[3])
+    parser.add_argument('--conflict-limits', type=int, nargs='+', default=[1, 3, 8])
+    parser.add_argument('--storage', nargs='+', default=['dense', 'sparse'], choices=['dense', 'sparse'])
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 997, 100_000])
+    parser.add_argument('--single-edges', type=int, default=2_000,
+                        help="stream prefix fed at batch size 1, which is slow on the NumPy path")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    try:
+        resolve_kernel('numba')
+    except ValueError as e:
+        print(e)
+        return 1
+
+    sources, dests = power_law_stream(args.edges, args.nodes, args.alpha, args.seed)
+    # Small integer weights keep float sums exact, fractional ones exercise rounding
+    rng = np.random.default_rng(args.seed)
+    weights = np.where(rng.random(len(sources)) < 0.5, 1.0, rng.random(len(sources)) * 10)
+
+    failures = 0
+    for width, depth, limit, storage, batch_size in product(
+            args.widths, args.depths, args.conflict_limits, args.storage, args.batch_sizes):
+        n = args.single_edges if batch_size == 1 else len(sources)
+        params = {'width': width, 'depth': depth, 'conflict_limit': limit, 'storage': storage}
+        compiled, compiled_seconds = build(params, 'numba', sources[:n], dests[:n], weights[:n], batch_size)
+        vectorized, vectorized_seconds = build(params, 'numpy', sources[:n], dests[:n], weights[:n], batch_size)
+        differ = differences(compiled, vectorized)
+        failures += bool(differ)
+        status = f"DIFFERENT {', '.join(differ)}" if differ else 'identical'
+        print(f"w={width} d={depth} c={limit} {storage} batch={batch_size}: {status}  "
+              f"numba {n / compiled_seconds:,.0f} edges/s, numpy {n / vectorized_seconds:,.0f} edges/s")
+
+    if failures:
+        print(f"{failures} configuration(s) differ between kernels")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,231 @@
+"""
+Measures PRBSketch accuracy against exact edge counts, to pick the
+cheapest width/depth/conflict_limit that meets an error budget.
+
+The edge file (or a synthetic power-law stream) is first counted exactly
+into a compact table: a HashIndex of distinct edges and a float64 count
+column. Every configuration of the grid is then sketched from the same
+stream in a process pool and scored on:
+
+- are: average relative error |estimate - true| / true over true edges,
+- exact_rate: fraction of true edges estimated exactly,
+- fpr: fraction of absent edges, drawn between seen nodes, with a
+  non-zero estimate,
+- hh_recall_edges/out/in: overlap of the sketch's top-k heaviest edges
+  and source/destination nodes with the true top k (with --counters > 0),
+- sketch_bytes, next to the exact table's bytes.
+
+    python benchmarks/evaluate.py --file dataset/test.txt --widths 64 128 256 \\
+        --depths 2 3 4 --budget 0.05 --output eval.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server'))
+from prb_sketch import PRBSketch
+from hash_index import HashIndex
+from edge_reader import iter_edge_chunks, sketch_file
+from streams import power_law_stream
+
+# Edges per update_batch call for synthetic streams
+CHUNK = 1 << 18
+
+
+class ExactCounts:
+    """Exact weight of every distinct edge: a HashIndex and a count column."""
+    def __init__(self):
+        self.index = HashIndex(key_width=2)
+        self.counts = np.zeros(1024)
+
+    def __len__(self):
+        return self.index.size
+
+    @property
+    def nbytes(self):
+        return self.index.nbytes + self.counts[:self.index.size].nbytes
+
+    def update_batch(self, sources, dests, weights=None):
+        ids = self.index.intern(np.stack([sources, dests], axis=1))
+        if self.index.size > len(self.counts):
+            counts = np.zeros(2 * self.index.size)
+            counts[:len(self.counts)] = self.counts
+            self.counts = counts
+        weights = np.ones(len(ids)) if weights is None else weights
+        self.counts[:self.index.size] += np.bincount(ids, weights=weights, minlength=self.index.size)
+
+    def edges(self):
+        """(pairs, counts) of every distinct edge, in first-seen order."""
+        return self.index.keys(), self.counts[:self.index.size]
+
+    def lookup(self, pairs):
+        ids = self.index.lookup(pairs)
+        return np.where(ids >= 0, self.counts[np.maximum(ids, 0)], 0.0)
+
+    def top_k(self, kind, k):
+        """Keys of the k heaviest 'edges', 'out' (source) or 'in' (dest) nodes."""
+        pairs, counts = self.edges()
+        if kind != 'edges':
+            nodes, inverse = np.unique(pairs[:, 0 if kind == 'out' else 1], return_inverse=True)
+            counts = np.bincount(inverse, weights=counts)
+            pairs = nodes[:, None]
+        return pairs[np.argsort(-counts, kind='stable')[:k]]
+
+
+def stream_chunks(source):
+    """(sources, dests) chunks of a file path or a synthetic stream spec."""
+    if isinstance(source, str):
+        yield from iter_edge_chunks(source)
+        return
+    sources, dests = power_law_stream(source['edges'], source['nodes'], source['alpha'], source['seed'])
+    for lo in range(0, len(sources), CHUNK):
+        yield sources[lo:lo + CHUNK], dests[lo:lo + CHUNK]
+
+
+def ground_truth(source, sample, absent, top_k, seed):
+    """Exact counts of the stream and the query sets every configuration is scored on."""
+    exact = ExactCounts()
+    start = time.perf_counter()
+    for sources, dests in stream_chunks(source):
+        exact.update_batch(sources, dests)
+    seconds = time.perf_counter() - start
+
+    rng = np.random.default_rng(seed)
+    pairs, counts = exact.edges()
+    if len(pairs) > sample:
+        picked = rng.choice(len(pairs), sample, replace=False)
+        pairs, counts = pairs[picked], counts[picked]
+
+    # Absent edges between nodes that do occur, so hashing sees real IDs
+    nodes = np.unique(exact.edges()[0])
+    candidates = rng.choice(nodes, size=(2 * absent, 2))
+    missing = candidates[exact.lookup(candidates) == 0][:absent]
+
+    return {
+        'present': pairs,
+        'true_weights': counts,
+        'absent': missing,
+        'top': {kind: exact.top_k(kind, top_k) for kind in ('edges', 'out', 'in')},
+        'distinct_edges': len(exact),
+        'total_weight': float(exact.counts[:len(exact)].sum()),
+        'exact_bytes': exact.nbytes,
+        'exact_seconds': seconds,
+    }
+
+
+def _recall(found, truth):
+    if len(truth) == 0:
+        return 1.0
+    matched = (found[:, None, :] == truth[None, :, :]).all(axis=2).any(axis=0)
+    return float(matched.mean())
+
+
+def evaluate_config(config, source, truth, top_k):
+    """Sketch the stream with one configuration and score it against truth."""
+    sketch = PRBSketch(**config)
+    start = time.perf_counter()
+    if isinstance(source, str):
+        sketch_file(sketch, source)
+    else:
+        for sources, dests in stream_chunks(source):
+            sketch.update_batch(sources, dests)
+    seconds = time.perf_counter() - start
+
+    present, true_weights, absent = truth['present'], truth['true_weights'], truth['absent']
+    estimates = sketch.edge_query_many(present[:, 0], present[:, 1])
+    false_hits = sketch.edge_query_many(absent[:, 0], absent[:, 1]) > 0
+    result = dict(config, **{
+        'are': float(np.mean(np.abs(estimates - true_weights) / true_weights)) if len(present) else 0.0,
+        'exact_rate': float(np.mean(np.isclose(estimates, true_weights))) if len(present) else 1.0,
+        'miss_rate': float(np.mean(estimates == 0)) if len(present) else 0.0,
+        'fpr': float(np.mean(false_hits)) if len(absent) else 0.0,
+        'sketch_bytes': sketch.nbytes,
+        'ingest_seconds': seconds,
+    })
+    if sketch.heavy:
+        for kind in ('edges', 'out', 'in'):
+            keys, _, _ = sketch.top_k(kind, top_k)
+            result[f'hh_recall_{kind}'] = _recall(keys.reshape(len(keys), -1), truth['top'][kind])
+    return result
+
+
+def cheapest(results, budget, max_fpr):
+    """The smallest sketch whose ARE (and FPR, if capped) is within budget."""
+    fits = [r for r in results if r['are'] <= budget and (max_fpr is None or r['fpr'] <= max_fpr)]
+    return min(fits, key=lambda r: r['sketch_bytes']) if fits else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score PRBSketch configurations against exact edge counts.")
+    parser.add_argument('--file', help="edge file to evaluate on; a synthetic power-law stream otherwise")
+    parser.add_argument('--edges', type=int, default=1_000_000)
+    parser.add_argument('--nodes', type=int, default=100_000)
+    parser.add_argument('--alpha', type=float, default=1.2)
+    parser.add_argument('--widths', type=int, nargs='+', default=[256, 512, 1024])
+    parser.add_argument('--depths', type=int, nargs='+', default=[2, 3, 4])
+    parser.add_argument('--conflict-limits', type=int, nargs='+', default=[3])
+    parser.add_argument('--storage', default='dense', choices=['dense', 'sparse'])
+    parser.add_argument('--counters', type=int, default=1024, help="heavy-hitter counters; 0 skips recall")
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--sample', type=int, default=100_000, help="present edges scored per configuration")
+    parser.add_argument('--absent', type=int, default=100_000, help="absent edges used for the FPR")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--budget', type=float, help="largest acceptable ARE; prints the cheapest fit")
+    parser.add_argument('--max-fpr', type=float)
+    parser.add_argument('--output', default='eval.json')
+    args = parser.parse_args(argv)
+
+    if args.file:
+        source = args.file
+    else:
+        source = {'edges': args.edges, 'nodes': args.nodes, 'alpha': args.alpha, 'seed': args.seed}
+    configs = [
+        {'width': width, 'depth': depth, 'conflict_limit': limit, 'storage': args.storage,
+         'heavy_hitters': args.counters}
+        for width, depth, limit in product(args.widths, args.depths, args.conflict_limits)
+    ]
+
+    truth = ground_truth(source, args.sample, args.absent, args.top_k, args.seed)
+    print(f"Exact table: {truth['distinct_edges']:,} distinct edges, {truth['total_weight']:,.0f} total weight, "
+          f"{truth['exact_bytes'] / 2**20:.1f} MiB, {truth['exact_seconds']:.1f}s")
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(evaluate_config, config, source, truth, args.top_k) for config in configs]
+        results = [future.result() for future in futures]
+
+    results.sort(key=lambda r: r['sketch_bytes'])
+    for r in results:
+        recall = f" hh-recall {r['hh_recall_edges']:.2f}" if 'hh_recall_edges' in r else ''
+        print(f"w={r['width']:<6} d={r['depth']:<2} c={r['conflict_limit']:<2} "
+              f"{r['sketch_bytes'] / 2**20:9.2f} MiB  ARE {r['are']:.4f}  exact {r['exact_rate']:.3f}  "
+              f"FPR {r['fpr']:.4f}{recall}")
+
+    best = None
+    if args.budget is not None:
+        best = cheapest(results, args.budget, args.max_fpr)
+        if best:
+            print(f"Cheapest within budget: width={best['width']} depth={best['depth']} "
+                  f"conflict_limit={best['conflict_limit']} ({best['sketch_bytes'] / 2**20:.2f} MiB)")
+        else:
+            print("No configuration meets the budget")
+
+    truth_summary = {key: truth[key] for key in ('distinct_edges', 'total_weight', 'exact_bytes', 'exact_seconds')}
+    with open(args.output, 'w') as f:
+        json.dump({
+            'meta': {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'args': vars(args)},
+            'truth': truth_summary,
+            'results': results,
+            'cheapest': best,
+        }, f, indent=2)
+    print(f"Results written to {args.output}")
+    return 0 if args.budget is None or best else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
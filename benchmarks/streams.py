@@ -0,0 +1,40 @@
+import numpy as np
+
+
+def power_law_stream(edges, nodes, alpha=1.2, seed=0):
+    """
+    A synthetic edge stream whose endpoint popularity follows a power law:
+    the node of popularity rank r is drawn with probability proportional to
+    r ** -alpha, on both ends independently. Ranks are shuffled onto node
+    IDs so hot nodes aren't simply the smallest IDs. Returns (sources,
+    dests) int64 arrays; the same arguments always give the same stream.
+    """
+    rng = np.random.default_rng(seed)
+    weights = np.arange(1, nodes + 1, dtype=np.float64) ** -alpha
+    cdf = np.cumsum(weights)
+    cdf /= cdf[-1]
+    ids = rng.permutation(nodes).astype(np.int64)
+
+    def draw():
+        return ids[np.minimum(np.searchsorted(cdf, rng.random(edges)), nodes - 1)]
+
+    return draw(), draw()
+
+
+def query_mix(sources, dests, count, nodes, present=0.5, seed=0):
+    """
+    `count` query pairs: a `present` fraction drawn from the stream itself,
+    the rest uniform random pairs, which are mostly absent edges.
+    """
+    rng = np.random.default_rng(seed)
+    hits = int(count * present)
+    picked = rng.integers(0, len(sources), hits)
+    qs = np.concatenate([sources[picked], rng.integers(0, nodes, count - hits)])
+    qd = np.concatenate([dests[picked], rng.integers(0, nodes, count - hits)])
+    order = rng.permutation(count)
+    return qs[order], qd[order]
+
+
+def write_edge_file(path, sources, dests):
+    """Write a stream as a tab-separated edge list the servers can ingest."""
+    np.savetxt(path, np.stack([sources, dests], axis=1), fmt='%d', delimiter='\t')
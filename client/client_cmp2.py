@@ -1,7 +1,16 @@
+import os
 import socket
-import pickle
+import sys
 import threading
 import time
+import numpy as np
+
+# The wire protocol module lives with the server
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server'))
+from protocol import (
+    MSG_CONFIG, MSG_QUERIES, MSG_EDGE_WEIGHTS, MSG_REACHABILITY, MSG_STATS, MSG_ERROR,
+    recv_frame, send_array, send_json
+)
 
 # Colors
 RESET = "\033[0m"
@@ -13,26 +22,44 @@ MAGENTA = "\033[95m"
 CYAN = "\033[96m"
 BOLD = "\033[1m"
 
-def receive_results(sock):
+# Query results beyond this many pairs are summarized rather than printed
+MAX_PRINTED = 20
+
+def receive_results(sock, queries):
+    weights = reachable = None
     while True:
         try:
-            results = pickle.loads(sock.recv(4096))
+            kind, body = recv_frame(sock)
+            if kind == MSG_ERROR:
+                print(f"\n{RED}Server error: {body['error']}{RESET}")
+                break
+            if kind == MSG_EDGE_WEIGHTS:
+                weights = body
+                continue
+            if kind == MSG_REACHABILITY:
+                reachable = body
+                continue
+            if kind != MSG_STATS:
+                continue
+
+            # A stats frame closes each round of results
             print(f"\n{BOLD}{YELLOW}--- PRB-Sketch Results ---{RESET}")
-            
-            for res in results:
-                if res.get('type') == 'stats':
-                    stats = res['stats']
-                    print(f"{BOLD}{CYAN}=== Sketch Statistics ==={RESET}")
-                    print(f"  {MAGENTA}Hash Functions (Depth): {stats['hash_functions']}{RESET}")
-                    print(f"  {MAGENTA}Total Edges Stored: {stats['total_edges']}{RESET}")
-                    print(f"  {MAGENTA}Occupied Cells: {stats['occupied_cells']}/{stats['total_cells']}{RESET}")
-                    print(f"  {MAGENTA}Occupancy Rate: {stats['occupancy_rate']:.2%}{RESET}")
-                else:
-                    src, dest = res['query']
-                    edge_weight = res['edge_weight']
-                    print(f"{BOLD}{BLUE}Query: {src} -> {dest}{RESET}")
-                    print(f"  {GREEN}Estimated Edge Weight: {edge_weight:.2f}{RESET}")
-            
+            count = len(queries)
+            for i in range(min(count, MAX_PRINTED)):
+                src, dest = queries[i]
+                edge_weight = weights[i]
+                print(f"{BOLD}{BLUE}Query: {src} -> {dest}{RESET}")
+                print(f"  {GREEN}Estimated Edge Weight: {edge_weight:.2f}{RESET}")
+            if count > MAX_PRINTED:
+                print(f"{CYAN}... and {count - MAX_PRINTED} more queries{RESET}")
+
+            stats = body
+            print(f"{BOLD}{CYAN}=== Sketch Statistics ==={RESET}")
+            print(f"  {MAGENTA}Hash Functions (Depth): {stats['hash_functions']}{RESET}")
+            print(f"  {MAGENTA}Total Edges Stored: {stats['total_edges']}{RESET}")
+            print(f"  {MAGENTA}Occupied Cells: {stats['occupied_cells']}/{stats['total_cells']}{RESET}")
+            print(f"  {MAGENTA}Occupancy Rate: {stats['occupancy_rate']:.2%}{RESET}")
+
             print(f"{CYAN}Waiting for next update...{RESET}")
         except EOFError:
             print(f"\n{RED}Server closed the connection.{RESET}")
@@ -58,9 +85,11 @@ if __name__ == "__main__":
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         try:
             s.connect(('localhost', 9992))
-            s.sendall(pickle.dumps(config))
+            queries = np.asarray(config.pop('queries'), dtype=np.int64).reshape(-1, 2)
+            send_json(s, MSG_CONFIG, config)
+            send_array(s, MSG_QUERIES, queries)
             print(f"{BOLD}{GREEN}[CLIENT] Connected to PRB Sketch Server with constrained config.{RESET}")
-            thread = threading.Thread(target=receive_results, args=(s,), daemon=True)
+            thread = threading.Thread(target=receive_results, args=(s, queries), daemon=True)
             thread.start()
             while thread.is_alive():
                 time.sleep(1)
@@ -0,0 +1,39 @@
+import os
+import socket
+import sys
+
+# The wire protocol module lives with the server
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server'))
+from protocol import MSG_METRICS, expect_frame, send_json
+
+# Colors
+RESET = "\033[0m"
+GREEN = "\033[92m"
+YELLOW = "\033[93m"
+RED = "\033[91m"
+CYAN = "\033[96m"
+BOLD = "\033[1m"
+
+
+def fetch_metrics(host='localhost', port=9992):
+    """One metrics snapshot from a running server, by metric name."""
+    with socket.create_connection((host, port)) as s:
+        send_json(s, MSG_METRICS, {})
+        return expect_frame(s, MSG_METRICS)
+
+
+if __name__ == "__main__":
+    try:
+        metrics = fetch_metrics()
+    except ConnectionRefusedError:
+        print(f"{RED}Connection refused. Is the server running?{RESET}")
+        sys.exit(1)
+
+    print(f"{BOLD}{GREEN}[CLIENT] Server metrics{RESET}")
+    for name, value in metrics.items():
+        if isinstance(value, dict):
+            print(f"{CYAN}{name}{RESET}: {value['count']} observed, "
+                  f"p50 {value['p50'] * 1e6:.1f}us, p90 {value['p90'] * 1e6:.1f}us, "
+                  f"p99 {value['p99'] * 1e6:.1f}us")
+        else:
+            print(f"{YELLOW}{name}{RESET}: {value}")
@@ -0,0 +1,255 @@
+import asyncio
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from prb_sketch import PRBSketch
+from edge_reader import DEFAULT_CHUNK_BYTES
+from local_ingest import build_shard, init_worker, shard_params, split_ranges
+from subscription import QuerySubscription
+from heavy_hitters import DEFAULT_COUNTERS
+from metrics import REGISTRY, serve_metrics
+from protocol import (
+    MSG_CONFIG, MSG_QUERIES, MSG_EDGE_WEIGHTS, MSG_REACHABILITY, MSG_STATS, MSG_TOP_K, MSG_METRICS,
+    expected, read_expected, read_frame, write_array, write_json, write_error
+)
+
+_ROUND_SECONDS = REGISTRY.histogram('server_query_round_seconds', "Time to answer and send one round of results")
+_SHARD_SECONDS = REGISTRY.histogram('server_shard_merge_seconds', "Time to merge one ingested shard")
+
+
+class HostedSketch:
+    """
+    A named sketch held by the server. Query answers are cached until the
+    sketch next changes, so any number of clients polling the same query
+    set between batches cost one computation.
+    """
+    def __init__(self, name, sketch):
+        self.name = name
+        self.sketch = sketch
+        self.version = 0
+        self.clients = 0
+        self.ingesting = 0
+        self._cached_version = -1
+        self._answers = {}
+        sketch.add_listener(self._on_change)
+
+    def _on_change(self, cells, nodes):
+        self.version += 1
+
+    def answer(self, key, sources, dests):
+        """(float32 edge weights, bool reachability) for the query set named by key."""
+        if self._cached_version != self.version:
+            self._answers = {}
+            self._cached_version = self.version
+        if key not in self._answers:
+            self._answers[key] = (
+                self.sketch.edge_query_many(sources, dests).astype(np.float32),
+                self.sketch.reachability_many(sources, dests)
+            )
+        return self._answers[key]
+
+
+class AsyncSketchServer:
+    """
+    Hosts many named sketches on one asyncio event loop.
+
+    A client names a sketch in its config: 'mode' 'attach' joins an existing
+    sketch, 'create' builds a new one from the client's width/depth (or from
+    a snapshot with engine 'snapshot'), and the default does whichever
+    applies. A file_path is sketched into the sketch only when it is
+    created, so clients attaching with the same config don't count the file
+    again; 'append' sketches it into an existing sketch. Files are sketched
+    with the local engine: byte ranges are parsed in a process pool and the
+    shards merged on the loop in file order, so queries served on the loop
+    never see a half-merged shard. Sketches outlive their clients and stay
+    available for attaching.
+
+    With 'subscribe' set in the config, answers are pushed only when a
+    merge changes them; otherwise they are resent every `refresh` seconds.
+    A client sending a metrics request instead of a config gets a snapshot
+    of the metrics registry back; metrics_port also serves them over HTTP.
+    """
+    def __init__(self, host='localhost', port=9992, workers=None, refresh=2.0,
+                 chunk_bytes=DEFAULT_CHUNK_BYTES, metrics_port=None):
+        self.host = host
+        self.port = port
+        self.metrics_port = metrics_port
+        self.workers = workers or os.cpu_count() or 1
+        self.refresh = refresh
+        self.chunk_bytes = chunk_bytes
+        self.sketches = {}
+        self.pool = None
+        self._tasks = set()
+
+    def _open(self, config):
+        name = config.get('sketch', 'default')
+        mode = config.get('mode', 'auto')
+        engine = config.get('engine', 'local')
+        if engine not in ('local', 'snapshot'):
+            raise ValueError(f"Unsupported engine '{engine}' (expected 'local' or 'snapshot')")
+        if mode not in ('auto', 'attach', 'create', 'append'):
+            raise ValueError(f"Unknown mode '{mode}' (expected 'auto', 'attach', 'create' or 'append')")
+
+        hosted = self.sketches.get(name)
+        if hosted is not None:
+            if mode == 'create':
+                raise ValueError(f"Sketch '{name}' already exists")
+            if mode == 'append':
+                if engine != 'local' or not config.get('file_path'):
+                    raise ValueError("mode 'append' needs the local engine and a file_path")
+                self._start_ingest(hosted, config['file_path'], config.get('save_snapshot'))
+            return hosted
+        if mode in ('attach', 'append'):
+            raise ValueError(f"No sketch named '{name}'")
+
+        if engine == 'snapshot':
+            sketch = PRBSketch.load(config['file_path'])
+        else:
+            sketch = PRBSketch(
+                width=config['width'],
+                depth=config['depth'],
+                conflict_limit=config.get('conflict_limit', 3),
+                storage=config.get('storage', 'dense'),
+                heavy_hitters=config.get('heavy_hitters', DEFAULT_COUNTERS if config.get('top_k') else 0),
+                deletions=config.get('deletions', False)
+            )
+        hosted = self.sketches[name] = HostedSketch(name, sketch)
+        print(f"[SERVER] Created sketch '{name}' ({sketch.width}x{sketch.width}x{sketch.depth}, "
+              f"{sketch.storage.name})")
+        if engine == 'local' and config.get('file_path'):
+            self._start_ingest(hosted, config['file_path'], config.get('save_snapshot'))
+        return hosted
+
+    def _start_ingest(self, hosted, file_path, save_path):
+        task = asyncio.get_running_loop().create_task(self._ingest(hosted, file_path, save_path))
+        # The loop only keeps weak references to tasks
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _ingest(self, hosted, file_path, save_path):
+        loop = asyncio.get_running_loop()
+        params = shard_params(hosted.sketch)
+        hosted.ingesting += 1
+        try:
+            jobs = [
+                loop.run_in_executor(self.pool, build_shard, file_path, start, end, params, self.chunk_bytes)
+                for start, end in split_ranges(file_path, self.workers)
+            ]
+            total = 0
+            for job in jobs:
+                shard, count, metrics = await job
+                REGISTRY.absorb(metrics)
+                with _SHARD_SECONDS.time():
+                    hosted.sketch.merge(shard)
+                total += count
+            print(f"[SERVER] Sketch '{hosted.name}': ingested {total} edges from {file_path}")
+            if save_path:
+                hosted.sketch.save(save_path)
+                print(f"[SERVER] Sketch '{hosted.name}' saved to {save_path}")
+        except Exception as e:
+            print(f"[SERVER] Sketch '{hosted.name}': ingest of {file_path} failed: {e}")
+        finally:
+            hosted.ingesting -= 1
+
+    async def _send_results(self, writer, hosted, weights, reachable, top_k):
+        await write_array(writer, MSG_EDGE_WEIGHTS, weights.astype(np.float32, copy=False))
+        await write_array(writer, MSG_REACHABILITY, reachable)
+        if top_k and hosted.sketch.heavy:
+            await write_json(writer, MSG_TOP_K, hosted.sketch.heavy.report(top_k))
+        await write_json(writer, MSG_STATS, hosted.sketch.get_stats())
+
+    async def _push_changes(self, hosted, reader, writer, sources, dests, top_k):
+        """Send the answers now and again whenever a change alters them."""
+        changed = asyncio.Event()
+        closed = False
+
+        async def watch_close():
+            nonlocal closed
+            # Subscribers send nothing after their queries; read() returns at EOF
+            await reader.read()
+            closed = True
+            changed.set()
+
+        subscription = QuerySubscription(hosted.sketch, sources, dests, on_dirty=changed.set)
+        watcher = asyncio.get_running_loop().create_task(watch_close())
+        try:
+            await self._send_results(writer, hosted, subscription.weights, subscription.reachable, top_k)
+            while True:
+                await changed.wait()
+                changed.clear()
+                if closed:
+                    raise EOFError("Connection closed")
+                started = time.perf_counter()
+                if subscription.refresh():
+                    await self._send_results(writer, hosted, subscription.weights, subscription.reachable, top_k)
+                _ROUND_SECONDS.observe(time.perf_counter() - started)
+        finally:
+            watcher.cancel()
+            subscription.close()
+
+    async def handle_client(self, reader, writer):
+        addr = writer.get_extra_info('peername')
+        print(f"[SERVER] Connected to {addr}")
+        hosted = None
+        try:
+            kind, body = await read_frame(reader)
+            if kind == MSG_METRICS:
+                await write_json(writer, MSG_METRICS, REGISTRY.snapshot())
+                return
+            config = expected(MSG_CONFIG, kind, body)
+            queries = (await read_expected(reader, MSG_QUERIES)).reshape(-1, 2)
+            hosted = self._open(config)
+            hosted.clients += 1
+            print(f"[SERVER] {addr} attached to '{hosted.name}' with {len(queries)} queries")
+
+            sources, dests = queries[:, 0], queries[:, 1]
+            top_k = config.get('top_k', 0)
+            if config.get('subscribe', False):
+                await self._push_changes(hosted, reader, writer, sources, dests, top_k)
+                return
+            # Clients polling the same query set share one answer per change
+            key = hashlib.blake2b(queries.tobytes(), digest_size=16).digest()
+            while True:
+                started = time.perf_counter()
+                weights, reachable = hosted.answer(key, sources, dests)
+                await self._send_results(writer, hosted, weights, reachable, top_k)
+                _ROUND_SECONDS.observe(time.perf_counter() - started)
+                await asyncio.sleep(self.refresh)
+        except (EOFError, ConnectionError):
+            print(f"Client {addr} disconnected.")
+        except Exception as e:
+            print(f"Client handling error: {e}")
+            try:
+                await write_error(writer, str(e))
+            except ConnectionError:
+                pass
+        finally:
+            if hosted is not None:
+                hosted.clients -= 1
+            writer.close()
+            print(f"[SERVER] Connection to {addr} closed.")
+
+    async def serve(self):
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker)
+        server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        print(f"[SERVER] Async PRB Sketch Server listening on {self.host}:{self.port}")
+        metrics_server = None
+        if self.metrics_port:
+            metrics_server = serve_metrics(self.metrics_port, self.host)
+            print(f"[SERVER] Metrics at http://{self.host}:{self.metrics_port}/metrics")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.pool.shutdown(cancel_futures=True)
+            if metrics_server:
+                metrics_server.shutdown()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(AsyncSketchServer().serve())
+    except KeyboardInterrupt:
+        print("\n[SERVER] Shutting down Async PRB Sketch Server...")
@@ -0,0 +1,138 @@
+import json
+import os
+import numpy as np
+from prb_sketch import PRBSketch
+from snapshot import read_snapshot, write_snapshot
+
+MANIFEST = 'MANIFEST.json'
+
+
+def _read_manifest(directory):
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def recover(directory):
+    """
+    Rebuild the sketch from a checkpoint directory by loading the base
+    snapshot and replaying the committed delta chain on top of it.
+    Returns (sketch, last_committed_batch_id), or (None, -1) when the
+    directory holds no checkpoint.
+    """
+    manifest = _read_manifest(directory)
+    if manifest is None:
+        return None, -1
+    if manifest['base']:
+        sketch = PRBSketch.load(os.path.join(directory, manifest['base']))
+    else:
+        sketch = PRBSketch(**manifest['params'])
+    for delta in manifest['deltas']:
+        _, arrays = read_snapshot(os.path.join(directory, delta['file']), mmap_mode=None)
+        sketch.import_cells({name[len('cells.'):]: arr for name, arr in arrays.items() if name.startswith('cells.')})
+        sketch.import_dsu({name[len('dsu.'):]: arr for name, arr in arrays.items() if name.startswith('dsu.')})
+        if sketch.heavy:
+            # Deltas carry the whole (small) heavy-hitter summaries
+            sketch.import_heavy({name[len('heavy.'):]: arr for name, arr in arrays.items() if name.startswith('heavy.')})
+    return sketch, manifest['batch_id']
+
+
+class SketchCheckpointer:
+    """
+    Incremental checkpoints of a sketch during streaming ingest.
+
+    The checkpointer listens to the sketch and remembers which cells and DSU
+    entries changed. commit(batch_id) writes only those to a delta file, so a
+    checkpoint costs time proportional to what the batch touched rather than
+    to the sketch size. MANIFEST.json names the base snapshot, the delta chain
+    and the last committed batch; it is replaced atomically and is the commit
+    point. After max_deltas deltas the chain is folded into a new base.
+
+    With every > 1 only every every-th commit is written, so a crash loses
+    the batches since; that only suits sources that can replay them.
+    """
+    def __init__(self, directory, sketch, last_batch_id=-1, every=1, max_deltas=64):
+        if sketch.deletions:
+            raise ValueError("Checkpoints don't cover the live edge table of a sketch with deletions")
+        self.directory = directory
+        self.sketch = sketch
+        self.every = every
+        self.max_deltas = max_deltas
+        self.last_batch_id = last_batch_id
+        self._pending = 0
+        self._cells = []
+        self._nodes = []
+        os.makedirs(directory, exist_ok=True)
+        self.manifest = _read_manifest(directory) or {
+            'params': {
+                'width': sketch.width,
+                'depth': sketch.depth,
+                'conflict_limit': sketch.conflict_limit,
+                'hash_family': sketch.hash_family,
+                'seed': sketch.seed,
+                'storage': sketch.storage.name,
+                'heavy_hitters': sketch.heavy_hitters,
+            },
+            'base': None,
+            'deltas': [],
+            'batch_id': last_batch_id,
+        }
+        sketch.add_listener(self._on_change)
+
+    def _on_change(self, cells, nodes):
+        self._cells.append(np.asarray(cells, dtype=np.int64))
+        self._nodes.append(nodes)
+
+    def commit(self, batch_id):
+        """
+        Mark batch_id as applied to the sketch and checkpoint if due.
+        Returns True when a checkpoint was written.
+        """
+        self._pending += 1
+        if self._pending < self.every:
+            return False
+        if len(self.manifest['deltas']) >= self.max_deltas:
+            self._write_base(batch_id)
+        else:
+            self._write_delta(batch_id)
+        self._pending = 0
+        self.last_batch_id = batch_id
+        return True
+
+    def _write_delta(self, batch_id):
+        cells = np.unique(np.concatenate(self._cells)) if self._cells else np.empty(0, np.int64)
+        nodes = np.unique(np.concatenate(self._nodes)) if self._nodes else np.empty(0, np.int64)
+        self._cells, self._nodes = [], []
+        arrays = {f'cells.{name}': arr for name, arr in self.sketch.export_cells(cells).items()}
+        for name, arr in self.sketch.export_dsu(nodes).items():
+            arrays[f'dsu.{name}'] = arr
+        if self.sketch.heavy:
+            for name, arr in self.sketch.heavy.to_arrays().items():
+                arrays[f'heavy.{name}'] = arr
+        name = f"delta-{batch_id:012d}.prb"
+        write_snapshot(os.path.join(self.directory, name), {'batch_id': batch_id}, arrays)
+        self.manifest['deltas'].append({'file': name, 'batch_id': batch_id})
+        self._commit_manifest(batch_id)
+
+    def _write_base(self, batch_id):
+        self._cells, self._nodes = [], []
+        stale = [d['file'] for d in self.manifest['deltas']]
+        if self.manifest['base']:
+            stale.append(self.manifest['base'])
+        name = f"base-{batch_id:012d}.prb"
+        self.sketch.save(os.path.join(self.directory, name))
+        self.manifest['base'] = name
+        self.manifest['deltas'] = []
+        self._commit_manifest(batch_id)
+        for old in stale:
+            if old != name:
+                os.remove(os.path.join(self.directory, old))
+
+    def _commit_manifest(self, batch_id):
+        self.manifest['batch_id'] = batch_id
+        path = os.path.join(self.directory, MANIFEST)
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(self.manifest, f)
+        os.replace(f"{path}.tmp", path)
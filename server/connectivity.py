@@ -0,0 +1,432 @@
+import numpy as np
+from dsu import ArrayDSU
+from hash_index import HashIndex
+
+
+class DynamicConnectivity:
+    """
+    Connectivity of an edge stream with deletions.
+
+    A live edge table maps every (source, dest) pair seen to its net weight,
+    and a pair is live while that is positive. Components are those of a
+    spanning forest of the live edges. They are kept flat in an ArrayDSU
+    (self.dsu): every node's parent is its component's label node, so
+    queries cost the same as in an insert-only sketch. Each component also
+    threads its members on a circular list and keeps its size at the label.
+
+    An edge going live that joins two components becomes a forest edge, and
+    the smaller components of every batch of joins are relabeled to the
+    largest. An edge dying off the forest changes nothing. When a forest
+    edge dies, the two trees it held together are walked side by side until
+    a live edge between the walks turns up as a replacement, or the smaller
+    tree is fully known and none of its edges leaves it. Only then does the
+    component split, and only the smaller side is relabeled (unless it
+    holds the label node, in which case the rest of the component is). A
+    batch deleting so much that the walks would cost more than relinking
+    every live edge is relinked in bulk instead.
+
+    Entries with a net weight of zero are dropped once they make up half of
+    a table that has doubled since the last compaction. Negative entries
+    are kept: they are deletions whose insertions may still arrive in
+    another shard.
+    """
+    def __init__(self):
+        self.dsu = ArrayDSU()
+        self.edges = HashIndex(key_width=2)
+        self.weight = np.zeros(1024)
+        self.forest = np.zeros(1024, dtype=bool)
+        # DSU indices of every entry's endpoints
+        self.ends = np.zeros((1024, 2), dtype=np.int32)
+        # Incidence lists: incidence 2 * entry + side is the entry seen from
+        # ends[entry, side]; head holds each node's first, chain the next one
+        self.chain = np.full(2048, -1, dtype=np.int64)
+        self.head = np.full(1024, -1, dtype=np.int64)
+        self.succ = np.arange(1024, dtype=np.int32)
+        self.pred = np.arange(1024, dtype=np.int32)
+        self.size = np.ones(1024, dtype=np.int64)
+        self._rebuild_at = 1024
+
+    def __len__(self):
+        return self.edges.size
+
+    @property
+    def nbytes(self):
+        return (self.dsu.nbytes + self.edges.nbytes + self.weight.nbytes + self.forest.nbytes
+                + self.ends.nbytes + self.chain.nbytes + self.head.nbytes + self.succ.nbytes
+                + self.pred.nbytes + self.size.nbytes)
+
+    def _grow(self, size):
+        if size <= len(self.weight):
+            return
+        capacity = len(self.weight)
+        while capacity < size:
+            capacity *= 2
+        weight = np.zeros(capacity)
+        forest = np.zeros(capacity, dtype=bool)
+        ends = np.zeros((capacity, 2), dtype=np.int32)
+        chain = np.full(2 * capacity, -1, dtype=np.int64)
+        used = len(self.weight)
+        weight[:used], forest[:used], ends[:used] = self.weight, self.forest, self.ends
+        chain[:2 * used] = self.chain
+        self.weight, self.forest, self.ends, self.chain = weight, forest, ends, chain
+
+    def _grow_nodes(self):
+        n = len(self.dsu)
+        if n <= len(self.head):
+            return
+        capacity = len(self.head)
+        while capacity < n:
+            capacity *= 2
+        used = len(self.head)
+        head = np.full(capacity, -1, dtype=np.int64)
+        succ = np.arange(capacity, dtype=np.int32)
+        pred = np.arange(capacity, dtype=np.int32)
+        size = np.ones(capacity, dtype=np.int64)
+        head[:used], succ[:used], pred[:used], size[:used] = self.head, self.succ, self.pred, self.size
+        self.head, self.succ, self.pred, self.size = head, succ, pred, size
+
+    def _attach(self, ids):
+        """Push the incidences of new entries onto their nodes' lists."""
+        if len(ids) == 0:
+            return
+        incidences = np.stack([2 * ids, 2 * ids + 1], axis=1).ravel()
+        nodes = self.ends[ids].ravel().astype(np.int64)
+        order = np.argsort(nodes, kind='stable')
+        incidences, nodes = incidences[order], nodes[order]
+        first = np.ones(len(nodes), dtype=bool)
+        first[1:] = nodes[1:] != nodes[:-1]
+        last = np.ones(len(nodes), dtype=bool)
+        last[:-1] = first[1:]
+        self.chain[incidences[:-1]] = incidences[1:]
+        self.chain[incidences[last]] = self.head[nodes[last]]
+        self.head[nodes[first]] = incidences[first]
+
+    def live(self, pairs):
+        """Whether each (source, dest) pair currently has a positive net weight."""
+        ids = self.edges.lookup(pairs)
+        return (ids >= 0) & (self.weight[np.maximum(ids, 0)] > 0)
+
+    def apply(self, pairs, deltas):
+        """
+        Add signed weights to distinct (source, dest) pairs. Returns the
+        pairs' net weights before and after, and the DSU indices whose
+        entries were created or changed.
+        """
+        pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+        nodes_before = len(self.dsu)
+        ends = self.dsu.intern(pairs.ravel()).reshape(-1, 2)
+        self._grow_nodes()
+        changed = [np.arange(nodes_before, len(self.dsu))]
+
+        entries_before = self.edges.size
+        ids = self.edges.intern(pairs)
+        self._grow(self.edges.size)
+        self.ends[ids] = ends
+        self._attach(np.arange(entries_before, self.edges.size))
+        before = self.weight[ids].copy()
+        after = before + deltas
+        born = np.flatnonzero((before <= 0) & (after > 0))
+        # Edges going live are held back until the cuts are done: they are
+        # not in the forest yet, so they can't stand in as replacements
+        self.weight[ids] = np.where((before <= 0) & (after > 0), before, after)
+
+        # Cut one forest edge at a time, so the forest always spans the
+        # live edges plus the dead forest edges not cut yet. Walking costs
+        # a Python step per incidence and relinking in bulk costs about as
+        # much as walking half the table, so a batch on course to walk more
+        # than that is relinked instead.
+        died = ids[(before > 0) & (after <= 0)]
+        broken = died[self.forest[died]]
+        budget = self.edges.size // 2
+        walked = 0
+        for i, entry in enumerate(broken.tolist()):
+            cut = None
+            if i < 64 or walked * len(broken) <= budget * i:
+                cut = self._cut(entry, budget - walked)
+            if cut is None:
+                self.forest[broken[i:]] = False
+                changed.append(self._relink())
+                break
+            nodes, steps = cut
+            walked += steps
+            changed.append(nodes)
+
+        self.weight[ids] = after
+        if len(born):
+            nodes, linked = self._link(ends[born, 0], ends[born, 1])
+            self.forest[ids[born[linked]]] = True
+            changed.append(nodes)
+
+        if self.edges.size >= self._rebuild_at:
+            self._rebuild()
+        return before, after, np.unique(np.concatenate(changed))
+
+    def _search(self, u, v, budget):
+        """
+        Walk the forest from u and from v in turns, looking for a live
+        non-forest edge between the two walks. Stops when one is found, or
+        when one walk runs out, having found its whole (smaller) tree; or
+        gives up (returning None) after budget incidences. Returns the
+        replacement entry (-1 if none), that tree's nodes and the endpoint
+        in it (when it ran out), and the incidences walked.
+        """
+        head, chain, forest, weight = self.head, self.chain, self.forest, self.weight
+        ends = self.ends.reshape(-1)
+        # Per walk: start, stack, nodes seen, and far end -> incidence of
+        # the live non-forest edges seen from it
+        walks = [(u, [u], {u}, {}), (v, [v], {v}, {})]
+        steps = 0
+        while True:
+            for (start, stack, seen, reach), (_, _, other_seen, other_reach) in (walks, walks[::-1]):
+                if not stack:
+                    for far, i in reach.items():
+                        if far not in seen:
+                            return i >> 1, None, None, steps
+                    return -1, seen, start, steps
+                if steps > budget:
+                    return None
+                i = int(head[stack.pop()])
+                while i >= 0:
+                    steps += 1
+                    # ends[i ^ 1] is the far end of incidence i
+                    y = int(ends[i ^ 1])
+                    if forest[i >> 1]:
+                        if y not in seen:
+                            if y in other_reach:
+                                return other_reach[y] >> 1, None, None, steps
+                            seen.add(y)
+                            stack.append(y)
+                    elif weight[i >> 1] > 0:
+                        if y in other_seen:
+                            return i >> 1, None, None, steps
+                        reach[y] = i
+                    i = int(chain[i])
+
+    def _cut(self, entry, budget):
+        """
+        Take a dead entry out of the forest, putting a replacement edge in
+        if there is one. Returns the DSU indices relabeled by a split and
+        the incidences walked, or None if that would take over budget.
+        """
+        self.forest[entry] = False
+        u, v = int(self.ends[entry, 0]), int(self.ends[entry, 1])
+        searched = self._search(u, v, budget)
+        if searched is None:
+            return None
+        replacement, side, near, steps = searched
+        if replacement >= 0:
+            self.forest[replacement] = True
+            return np.empty(0, dtype=np.int64), steps
+        return self._split(side, v if near == u else u), steps
+
+    def _split(self, side, far):
+        """Make side, a tree cut off its component, a component of its own."""
+        parent, succ, pred = self.dsu.parent, self.succ, self.pred
+        # Unthread side from the member list, one run of side nodes at a time
+        for x in side:
+            before = int(pred[x])
+            if before in side:
+                continue
+            after = int(succ[x])
+            while after in side:
+                after = int(succ[after])
+            succ[before] = after
+            pred[after] = before
+        nodes = np.fromiter(side, dtype=np.int64, count=len(side))
+        succ[nodes] = np.roll(nodes, -1)
+        pred[nodes] = np.roll(nodes, 1)
+
+        label = int(parent[nodes[0]])
+        rest = self.size[label] - len(nodes)
+        if label not in side:
+            parent[nodes] = nodes[0]
+            self.size[nodes[0]] = len(nodes)
+            self.size[label] = rest
+            return nodes
+        # The label went with the small side, which keeps it
+        if self._walkable(rest):
+            moved = self._members(np.array([far]), rest)[0]
+        else:
+            moved = np.flatnonzero(parent[:len(self.dsu)] == label)
+            moved = moved[~np.isin(moved, nodes)]
+        parent[moved] = far
+        self.size[far] = rest
+        self.size[label] = len(nodes)
+        return moved
+
+    def _walkable(self, longest):
+        """Whether walking lists this long beats scanning every label."""
+        return longest <= len(self.dsu) >> 10
+
+    def _members(self, starts, longest):
+        """
+        Nodes on the member lists through starts, with the start each was
+        reached from. Lists are walked a step at a time while the longest is
+        short; otherwise the labels are scanned, so starts must be labels.
+        """
+        if self._walkable(longest):
+            nodes, owners = [starts], [starts]
+            cur, owner = self.succ[starts].astype(np.int64), starts
+            while len(cur):
+                more = cur != owner
+                cur, owner = cur[more], owner[more]
+                nodes.append(cur)
+                owners.append(owner)
+                cur = self.succ[cur].astype(np.int64)
+            return np.concatenate(nodes), np.concatenate(owners)
+        parent = self.dsu.parent
+        chosen = np.zeros(len(self.dsu), dtype=bool)
+        chosen[starts] = True
+        nodes = np.flatnonzero(chosen[parent[:len(self.dsu)]])
+        return nodes, parent[nodes].astype(np.int64)
+
+    def _link(self, a, b):
+        """
+        Join the components of every (a, b) pair of node indices. The
+        largest component of each group that comes together keeps its
+        label. Returns the relabeled indices and a bool array marking the
+        pairs that joined two components, which go into the forest.
+        """
+        parent = self.dsu.parent
+        labels, local = np.unique(np.concatenate([parent[a], parent[b]]), return_inverse=True)
+        groups = ArrayDSU(capacity=len(labels))
+        _, linked = groups.link(local[:len(a)], local[len(a):])
+        if not linked.any():
+            return np.empty(0, dtype=np.int64), linked
+
+        group = groups.find(np.arange(len(labels)))
+        order = np.lexsort((labels, -self.size[labels], group))
+        group, ordered = group[order], labels[order]
+        heads = np.ones(len(order), dtype=bool)
+        heads[1:] = group[1:] != group[:-1]
+        run = np.cumsum(heads) - 1
+        keeper = ordered[heads][run]
+        totals = np.bincount(run, weights=self.size[ordered])
+
+        moved = ordered[ordered != keeper]
+        if len(moved) == 0:
+            return moved, linked
+        nodes, owners = self._members(moved, int(self.size[moved].max()))
+        target = np.empty(len(self.dsu), dtype=np.int64)
+        target[ordered] = keeper
+        parent[nodes] = target[owners]
+
+        # Splice the member lists of every group into one: each label takes
+        # over the successor of the next label in its group
+        nxt = np.arange(1, len(ordered) + 1)
+        starts = np.flatnonzero(heads)
+        ends = np.append(starts[1:], len(ordered)) - 1
+        nxt[ends] = starts
+        spliced = self.succ[ordered[nxt]]
+        self.succ[ordered] = spliced
+        self.pred[spliced] = ordered
+        self.size[keeper[heads]] = totals.astype(np.int64)
+        return nodes, linked
+
+    def _relink(self):
+        """
+        Rebuild the forest and labels from the live edges in one vectorized
+        pass. Every component keeps the label of its largest old part it
+        holds, if any. Returns the nodes relabeled.
+        """
+        n, k = self.edges.size, len(self.dsu)
+        old = self.dsu.parent[:k].astype(np.int64)
+        live = np.flatnonzero(self.weight[:n] > 0)
+        groups = ArrayDSU(capacity=k)
+        _, linked = groups.link(self.ends[live, 0], self.ends[live, 1])
+        self.forest[:n] = False
+        self.forest[live[linked]] = True
+
+        root = groups.find(np.arange(k))
+        held = np.flatnonzero(old == np.arange(k))
+        held = held[np.lexsort((held, -self.size[held], root[held]))]
+        first = np.ones(len(held), dtype=bool)
+        first[1:] = root[held[1:]] != root[held[:-1]]
+        label = np.arange(k)
+        label[root[held[first]]] = held[first]
+        labels = label[root]
+        self._thread(labels)
+        return np.flatnonzero(labels != old)
+
+    def _thread(self, labels):
+        """Label every node, rethreading the member lists and sizes to match."""
+        k = len(labels)
+        if self.dsu.parent.flags.writeable:
+            self.dsu.parent[:k] = labels
+        order = np.argsort(labels, kind='stable')
+        heads = np.ones(k, dtype=bool)
+        heads[1:] = labels[order][1:] != labels[order][:-1]
+        starts = np.flatnonzero(heads)
+        nxt = np.arange(1, k + 1)
+        nxt[np.append(starts[1:], k) - 1] = starts
+        self.succ[order] = order[nxt]
+        self.pred[order[nxt]] = order
+        self.size[:k] = np.bincount(labels, minlength=k)
+
+    def _rebuild(self):
+        """Drop zero entries if they make up half the table."""
+        n = self.edges.size
+        keep = np.flatnonzero(self.weight[:n] != 0)
+        if 2 * len(keep) < n:
+            self.edges.compact(keep)
+            m = len(keep)
+            self.weight[:m], self.ends[:m], self.forest[:m] = self.weight[keep], self.ends[keep], self.forest[keep]
+            self.weight[m:n] = 0
+            self.forest[m:n] = False
+            self.head[:] = -1
+            self.chain[:] = -1
+            self._attach(np.arange(m))
+        self._rebuild_at = 2 * max(self.edges.size, 512)
+
+    def merge(self, other):
+        """
+        Add another table's net weights into this one. Returns the pairs it
+        held and, as apply does, their net weights here before and after
+        and the DSU indices that changed.
+        """
+        nodes_before = len(self.dsu)
+        self.dsu.intern(other.dsu.node_ids(np.arange(len(other.dsu))))
+        self._grow_nodes()
+        n = other.edges.size
+        listed = np.flatnonzero(other.weight[:n] != 0)
+        pairs = other.edges.keys()[listed]
+        before, after, changed = self.apply(pairs, other.weight[listed])
+        return pairs, before, after, np.union1d(np.arange(nodes_before, len(self.dsu)), changed)
+
+    def to_arrays(self):
+        n = self.edges.size
+        arrays = {f'edges.{name}': arr for name, arr in self.edges.to_arrays().items()}
+        arrays['weight'] = self.weight[:n]
+        arrays['forest'] = self.forest[:n]
+        arrays['ends'] = self.ends[:n]
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays, dsu):
+        """
+        Rebuild the table around to_arrays output, sharing an already loaded
+        DSU. The incidence and member lists are derived again.
+        """
+        conn = cls.__new__(cls)
+        conn.dsu = dsu
+        conn.edges = HashIndex.from_arrays({
+            name[len('edges.'):]: arr for name, arr in arrays.items() if name.startswith('edges.')
+        })
+        n = conn.edges.size
+        capacity = max(len(conn.edges._table) // 2, 16)
+        conn.weight = np.zeros(capacity)
+        conn.forest = np.zeros(capacity, dtype=bool)
+        conn.ends = np.zeros((capacity, 2), dtype=np.int32)
+        conn.chain = np.full(2 * capacity, -1, dtype=np.int64)
+        conn.weight[:n] = arrays['weight']
+        conn.forest[:n] = arrays['forest']
+        conn.ends[:n] = arrays['ends']
+        conn._rebuild_at = 2 * max(n, 512)
+
+        conn.head = np.full(max(len(dsu.parent), 16), -1, dtype=np.int64)
+        conn.succ = np.arange(len(conn.head), dtype=np.int32)
+        conn.pred = np.arange(len(conn.head), dtype=np.int32)
+        conn.size = np.ones(len(conn.head), dtype=np.int64)
+        conn._attach(np.arange(n))
+        conn._thread(dsu.find(np.arange(len(dsu))))
+        return conn
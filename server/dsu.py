@@ -0,0 +1,153 @@
+import numpy as np
+from hashing import as_node_ids
+from hash_index import HashIndex
+
+
+class ArrayDSU:
+    """
+    Disjoint Set Union over dense node indices. Raw node IDs are interned
+    into int32 indices by a HashIndex; parent and rank live in growable numpy
+    arrays, finds use iterative path halving and whole batches of unions are
+    applied at once by union_many.
+    """
+    def __init__(self, capacity=1024):
+        self.nodes = HashIndex(key_width=1, capacity=capacity)
+        self.parent = np.arange(capacity, dtype=np.int32)
+        self.rank = np.zeros(capacity, dtype=np.int32)
+
+    def __len__(self):
+        return self.nodes.size
+
+    @property
+    def nbytes(self):
+        return self.nodes.nbytes + self.parent.nbytes + self.rank.nbytes
+
+    def node_ids(self, idx):
+        """Raw node IDs of the given indices."""
+        return self.nodes.keys()[idx, 0]
+
+    def lookup(self, raw_ids):
+        """Indices of raw node IDs, -1 for nodes never seen."""
+        return self.nodes.lookup(as_node_ids(raw_ids))
+
+    def _reserve(self, size):
+        if size <= len(self.parent):
+            return
+        capacity = max(len(self.parent), 16)
+        while capacity < size:
+            capacity *= 2
+        parent = np.arange(capacity, dtype=np.int32)
+        rank = np.zeros(capacity, dtype=np.int32)
+        parent[:len(self.parent)] = self.parent
+        rank[:len(self.rank)] = self.rank
+        self.parent, self.rank = parent, rank
+
+    def intern(self, raw_ids):
+        """Indices of raw node IDs, adding unseen nodes as singletons."""
+        # parent and rank grow before a concurrent find can see the new indices
+        return self.nodes.intern(as_node_ids(raw_ids), reserve=self._reserve)
+
+    def find(self, idx):
+        """Roots of the given node indices, halving the paths walked."""
+        parent = self.parent
+        compress = parent.flags.writeable
+        x = np.array(idx, dtype=np.int64)
+        while True:
+            p = parent[x]
+            active = p != x
+            if not active.any():
+                return x
+            grandparent = parent[p]
+            if compress:
+                parent[x[active]] = grandparent[active]
+            x = np.where(active, grandparent, x)
+
+    def union_many(self, src_ids, dst_ids):
+        """
+        Union every (src, dst) pair of raw node IDs. Returns the indices
+        whose parent or rank entry changed, including new nodes.
+        """
+        before = self.nodes.size
+        a = self.intern(src_ids)
+        b = self.intern(dst_ids)
+        changed, _ = self.link(a, b)
+        return np.unique(np.concatenate([np.arange(before, self.nodes.size), changed]))
+
+    def link(self, a, b):
+        """
+        Union every (a, b) pair of node indices. Pairs are applied in
+        rounds: each round links every still-separate root pair, the root
+        with the lower (rank, index) becoming the child. Links only ever go
+        up that order, so a round can never close a cycle. Returns the
+        indices whose entry changed and a bool array marking the pairs that
+        joined two components, which form a spanning forest of the pairs.
+        """
+        a = np.asarray(a, dtype=np.int64)
+        b = np.asarray(b, dtype=np.int64)
+        pairs = np.arange(len(a))
+        linked = np.zeros(len(a), dtype=bool)
+        changed = [np.empty(0, dtype=np.int64)]
+        while len(a):
+            ra, rb = self.find(a), self.find(b)
+            split = ra != rb
+            ra, rb, pairs = ra[split], rb[split], pairs[split]
+            if len(ra) == 0:
+                break
+            flip = (self.rank[ra] > self.rank[rb]) | ((self.rank[ra] == self.rank[rb]) & (ra > rb))
+            child = np.where(flip, rb, ra)
+            head = np.where(flip, ra, rb)
+            self.parent[child] = head
+            # Several pairs may have linked the same child; only the link
+            # that landed can raise its head's rank or count as a forest edge
+            landed = np.flatnonzero(self.parent[child] == head)
+            _, first = np.unique(child[landed], return_index=True)
+            linked[pairs[landed[first]]] = True
+            bump = (self.parent[child] == head) & (self.rank[child] == self.rank[head])
+            self.rank[head[bump]] += 1
+            changed += [child, head[bump]]
+            a, b = ra, rb
+        return np.unique(np.concatenate(changed)), linked
+
+    def connected(self, src_ids, dst_ids):
+        """Whether each (src, dst) pair of raw node IDs shares a component."""
+        a = self.lookup(src_ids)
+        b = self.lookup(dst_ids)
+        known = (a >= 0) & (b >= 0)
+        result = np.zeros(len(a), dtype=bool)
+        result[known] = self.find(a[known]) == self.find(b[known])
+        return result
+
+    def export(self, idx=None):
+        """Entries of the given indices (all by default) keyed by raw node ID."""
+        if idx is None:
+            idx = np.arange(self.nodes.size)
+        idx = np.asarray(idx, dtype=np.int64)
+        return {
+            'nodes': self.node_ids(idx),
+            'parent': self.node_ids(self.parent[idx]),
+            'rank': self.rank[idx],
+        }
+
+    def restore(self, arrays):
+        """Overwrite entries from an export result."""
+        nodes = self.intern(arrays['nodes'])
+        parents = self.intern(arrays['parent'])
+        self.parent[nodes] = parents
+        self.rank[nodes] = arrays['rank']
+
+    def to_arrays(self):
+        arrays = {f'index.{name}': arr for name, arr in self.nodes.to_arrays().items()}
+        arrays['parent'] = self.parent[:self.nodes.size]
+        arrays['rank'] = self.rank[:self.nodes.size]
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Rebuild a DSU around arrays produced by to_arrays, without copying."""
+        dsu = cls.__new__(cls)
+        dsu.nodes = HashIndex.from_arrays({
+            name[len('index.'):]: arr for name, arr in arrays.items() if name.startswith('index.')
+        })
+        dsu.parent = arrays['parent']
+        dsu.rank = arrays['rank']
+        return dsu
@@ -0,0 +1,166 @@
+import mmap
+import os
+from contextlib import nullcontext
+import numpy as np
+
+DEFAULT_CHUNK_BYTES = 1 << 22
+
+_NEWLINE = ord('\n')
+_COMMENT = ord('#')
+_MINUS = ord('-')
+_DOT = ord('.')
+_ZERO = ord('0')
+_SEPARATOR = np.zeros(256, dtype=bool)
+_SEPARATOR[[ord(' '), ord('\t'), ord('\r'), ord('\n')]] = True
+# int64 holds every 18-digit number and the 19-digit ones up to 2^63 - 1
+_MAX_DIGITS = 19
+_POW10 = 10 ** np.arange(_MAX_DIGITS, dtype=np.int64)
+
+
+def _line_start(mm, pos):
+    """Offset of the first line starting at or after pos."""
+    if pos <= 0:
+        return 0
+    newline = mm.find(b'\n', pos - 1)
+    return len(mm) if newline < 0 else newline + 1
+
+
+def _field_bytes(buf, lo, hi):
+    """
+    Every byte of the fields buf[lo[i]:hi[i] + 1], as its field, its offset
+    in buf and its value less '0' (above 9 for a non-digit).
+    """
+    lengths = hi - lo + 1
+    field = np.repeat(np.arange(len(lo)), lengths)
+    pos = np.repeat(lo - np.cumsum(lengths) + lengths, lengths) + np.arange(int(lengths.sum()))
+    return field, pos, buf[pos] - _ZERO
+
+
+def _unsigned(buf, lo, hi):
+    """Values of digit-only fields, and a mask of the fields that aren't or overflow int64."""
+    field, pos, digit = _field_bytes(buf, lo, hi)
+    bad = hi - lo + 1 > _MAX_DIGITS
+    bad[field[digit > 9]] = True
+    values = digit.astype(np.int64) * _POW10[np.minimum(hi[field] - pos, _MAX_DIGITS - 1)]
+    values = np.add.reduceat(values, np.cumsum(hi - lo + 1) - (hi - lo + 1))
+    # 19 digits past int64 wrap around to a negative sum
+    return values, bad | (values < 0)
+
+
+def _decimal(buf, lo, hi):
+    """
+    Values of fields holding [-]digits[.digits] or [-].digits, and a mask of
+    the other fields.
+    """
+    negative = (buf[lo] == _MINUS) & (hi > lo)
+    lo = lo + negative
+    field, pos, digit = _field_bytes(buf, lo, hi)
+    numeric = digit <= 9
+    dot = buf[pos] == _DOT
+    dots = np.bincount(field[dot], minlength=len(lo))
+    digits = np.bincount(field[numeric], minlength=len(lo))
+    bad = (dots > 1) | (digits == 0) | (digits >= _MAX_DIGITS)
+    bad[field[~numeric & ~dot]] = True
+    point = hi + 1
+    point[field[dot]] = pos[dot]
+    # A digit weighs 10 to the number of digits after it
+    after = hi[field] - pos - (pos < point[field])
+    values = np.where(numeric, digit, 0).astype(np.int64) * _POW10[np.clip(after, 0, _MAX_DIGITS - 1)]
+    values = np.add.reduceat(values, np.cumsum(hi - lo + 1) - (hi - lo + 1))
+    values = values / 10.0 ** np.minimum(hi - np.minimum(point, hi), _MAX_DIGITS)
+    return np.where(negative, -values, values), bad
+
+
+def _unsupported(buf, newlines, what, pos):
+    """ValueError quoting the line holding byte pos."""
+    line = np.searchsorted(newlines, pos)
+    start = newlines[line - 1] + 1 if line else 0
+    end = newlines[line] if line < len(newlines) else len(buf)
+    return ValueError(f"Unsupported {what} in line {buf[start:end].tobytes().decode(errors='replace')!r}")
+
+
+def parse_edges(buf, weighted=False):
+    """
+    Parse a uint8 buffer of whole edge-list lines into (sources, dests)
+    int64 arrays. A line contributes its first two whitespace-separated
+    fields, which must be unsigned integers that fit in int64; lines
+    starting with '#' and lines with fewer than two fields are skipped.
+    With weighted=True a float64 weights array is returned as well, read
+    from an optional third field holding a signed decimal number (default
+    1), so '3 7 -1' retracts one unit of edge (3, 7) and '3 7 0.5' adds half
+    of one. Any other node ID or third field (e.g. '-1', '1e-3' or 'abc')
+    raises ValueError naming the line.
+    """
+    empty = np.empty(0, dtype=np.int64)
+    if len(buf) == 0:
+        return (empty, empty, np.empty(0)) if weighted else (empty, empty)
+    field = ~_SEPARATOR[buf]
+    starts = np.flatnonzero(field & ~np.r_[False, field[:-1]])
+    ends = np.flatnonzero(field & ~np.r_[field[1:], False])
+
+    # Drop fields that sit on comment lines
+    newlines = np.flatnonzero(buf == _NEWLINE)
+    field_line = np.searchsorted(newlines, starts)
+    line_starts = np.r_[0, newlines + 1]
+    comment = buf[np.minimum(line_starts, len(buf) - 1)] == _COMMENT
+    keep = ~comment[field_line]
+    starts, ends, field_line = starts[keep], ends[keep], field_line[keep]
+    first = np.ones(len(field_line), dtype=bool)
+    first[1:] = field_line[1:] != field_line[:-1]
+    second = np.flatnonzero(~first & np.r_[False, first[:-1]])
+    if len(second) == 0:
+        return (empty, empty, np.empty(0)) if weighted else (empty, empty)
+    ids = np.r_[second - 1, second]
+    values, bad = _unsigned(buf, starts[ids], ends[ids])
+    if bad.any():
+        raise _unsupported(buf, newlines, 'node ID', starts[ids][bad].min())
+    sources, dests = values[:len(second)], values[len(second):]
+    if not weighted:
+        return sources, dests
+
+    # The field after a line's second one, if on the same line, is its weight
+    third = second[(second + 1 < len(first)) & ~first[np.minimum(second + 1, len(first) - 1)]] + 1
+    weights = np.ones(len(second))
+    if len(third):
+        values, bad = _decimal(buf, starts[third], ends[third])
+        if bad.any():
+            raise _unsupported(buf, newlines, 'edge weight', starts[third][bad].min())
+        weights[np.searchsorted(second, third - 1)] = values
+    return sources, dests, weights
+
+
+def iter_edge_chunks(file_path, start=0, end=None, chunk_bytes=DEFAULT_CHUNK_BYTES, weighted=False):
+    """
+    Memory-map an edge file in place and yield parse_edges results for the
+    lines starting in [start, end), about chunk_bytes at a time.
+    """
+    if os.path.getsize(file_path) == 0:
+        return
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        size = len(mm)
+        end = size if end is None else min(end, size)
+        pos = _line_start(mm, start)
+        while pos < end:
+            stop = _line_start(mm, min(pos + chunk_bytes, end))
+            yield _parse_range(mm, pos, stop, weighted)
+            pos = stop
+
+
+def _parse_range(mm, start, stop, weighted):
+    # The frombuffer view must not outlive this call, or the mmap can't close
+    return parse_edges(np.frombuffer(mm, dtype=np.uint8, count=stop - start, offset=start), weighted)
+
+
+def sketch_file(sketch, file_path, start=0, end=None, chunk_bytes=DEFAULT_CHUNK_BYTES, lock=None):
+    """
+    Feed every edge of file_path (or of a byte range of it) to sketch. A
+    sketch that accepts deletions also reads the signed weight column.
+    lock, if given, is held around each chunk's update.
+    """
+    lock = lock or nullcontext()
+    count = 0
+    for chunk in iter_edge_chunks(file_path, start, end, chunk_bytes, weighted=sketch.deletions):
+        with lock:
+            sketch.update_batch(*chunk)
+        count += len(chunk[0])
+    return count
@@ -0,0 +1,177 @@
+import numpy as np
+from hashing import mix64
+
+
+def unique_rows(keys):
+    """
+    Distinct rows of an (n, k) int64 array in order of first appearance.
+    Returns (uniq, first, inverse) like np.unique, except that uniq[i] is
+    the i-th distinct row to appear rather than the i-th smallest.
+    """
+    n = len(keys)
+    if n == 0:
+        return keys[:0], np.empty(0, np.int64), np.empty(0, np.int64)
+    order = np.lexsort(keys.T[::-1])
+    ordered = keys[order]
+    starts = np.empty(n, dtype=bool)
+    starts[0] = True
+    starts[1:] = (ordered[1:] != ordered[:-1]).any(axis=1)
+    group = np.cumsum(starts) - 1
+    # lexsort is stable, so the head of every run is its first occurrence
+    first = order[starts]
+    by_appearance = np.argsort(first, kind='stable')
+    relabel = np.empty(len(first), np.int64)
+    relabel[by_appearance] = np.arange(len(first))
+    inverse = np.empty(n, np.int64)
+    inverse[order] = relabel[group]
+    first = first[by_appearance]
+    return keys[first], first, inverse
+
+
+class HashIndex:
+    """
+    Open-addressing (linear probing) map from fixed-width int64 key tuples
+    to dense ids 0..size-1, assigned in insertion order. The probe table and
+    the keys are flat numpy arrays and every operation works on a whole
+    batch of keys at once, so there is no Python object per entry.
+    """
+    def __init__(self, key_width=1, capacity=1024):
+        self.key_width = key_width
+        self.size = 0
+        cap = 16
+        while cap < 2 * capacity:
+            cap *= 2
+        self._table = np.full(cap, -1, dtype=np.int64)
+        self._keys = np.empty((cap // 2, key_width), dtype=np.int64)
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def nbytes(self):
+        return self._table.nbytes + self._keys.nbytes
+
+    def keys(self):
+        """Keys in id order, as an (size, key_width) array view."""
+        return self._keys[:self.size]
+
+    def _as_keys(self, keys):
+        return np.asarray(keys, dtype=np.int64).reshape(-1, self.key_width)
+
+    def _hash(self, keys):
+        h = mix64(keys[:, 0].view(np.uint64))
+        for col in range(1, self.key_width):
+            h = mix64(h ^ keys[:, col].view(np.uint64))
+        return (h & np.uint64(len(self._table) - 1)).astype(np.int64)
+
+    def _probe(self, keys):
+        """Table position holding each key, or the empty slot ending its probe."""
+        mask = len(self._table) - 1
+        pos = self._hash(keys)
+        result = np.empty(len(keys), dtype=np.int64)
+        pending = np.arange(len(keys))
+        while len(pending):
+            p = pos[pending]
+            ids = self._table[p]
+            done = ids < 0
+            occupied = np.flatnonzero(~done)
+            if len(occupied):
+                same = (self._keys[ids[occupied]] == keys[pending[occupied]]).all(axis=1)
+                done[occupied[same]] = True
+            result[pending[done]] = p[done]
+            pending = pending[~done]
+            pos[pending] = (pos[pending] + 1) & mask
+        return result
+
+    def _next_empty(self, pos):
+        mask = len(self._table) - 1
+        pos = pos.copy()
+        taken = np.flatnonzero(self._table[pos] >= 0)
+        while len(taken):
+            pos[taken] = (pos[taken] + 1) & mask
+            taken = taken[self._table[pos[taken]] >= 0]
+        return pos
+
+    def _place(self, ids, pos):
+        """Write ids of absent keys into the empty slots their probes ended on."""
+        mask = len(self._table) - 1
+        while len(ids):
+            # several new keys may have stopped on the same empty slot;
+            # the first claims it and the rest keep probing
+            slots, first = np.unique(pos, return_index=True)
+            self._table[slots] = ids[first]
+            lost = np.ones(len(ids), dtype=bool)
+            lost[first] = False
+            ids = ids[lost]
+            pos = self._next_empty((pos[lost] + 1) & mask)
+
+    def _rebuild(self, capacity):
+        self._table = np.full(capacity, -1, dtype=np.int64)
+        ids = np.arange(self.size, dtype=np.int64)
+        self._place(ids, self._next_empty(self._hash(self.keys())))
+
+    def lookup(self, keys):
+        """Ids of the given keys, -1 where a key is absent."""
+        keys = self._as_keys(keys)
+        if len(keys) == 0 or self.size == 0:
+            return np.full(len(keys), -1, dtype=np.int64)
+        return self._table[self._probe(keys)]
+
+    def intern(self, keys, reserve=None):
+        """
+        Ids of the given keys, inserting absent ones in order of first
+        appearance. reserve, if given, is called with the new size before
+        any new id becomes visible, so arrays indexed by id can grow first.
+        """
+        keys = self._as_keys(keys)
+        uniq, _, inverse = unique_rows(keys)
+        ids = self.lookup(uniq)
+        missing = np.flatnonzero(ids < 0)
+        if len(missing):
+            needed = self.size + len(missing)
+            if reserve is not None:
+                reserve(needed)
+            if 2 * needed > len(self._table):
+                capacity = len(self._table)
+                while 2 * needed > capacity:
+                    capacity *= 2
+                self._rebuild(capacity)
+            if needed > len(self._keys):
+                grown = np.empty((len(self._table) // 2, self.key_width), dtype=np.int64)
+                grown[:self.size] = self.keys()
+                self._keys = grown
+            new_ids = np.arange(self.size, needed, dtype=np.int64)
+            self._keys[new_ids] = uniq[missing]
+            pos = self._probe(uniq[missing])
+            self.size = needed
+            self._place(new_ids, pos)
+            ids[missing] = new_ids
+        return ids[inverse]
+
+    def to_arrays(self):
+        return {'table': self._table, 'keys': self.keys()}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Rebuild an index around arrays produced by to_arrays, without copying."""
+        index = cls.__new__(cls)
+        index._table = arrays['table']
+        index._keys = arrays['keys']
+        index.key_width = index._keys.shape[1]
+        index.size = len(index._keys)
+        return index
+
+    def compact(self, live_ids):
+        """
+        Drop every entry whose id is not in live_ids and renumber the
+        survivors densely in their previous order. Returns an array mapping
+        old ids to new ones (-1 for dropped entries).
+        """
+        live_ids = np.unique(np.asarray(live_ids, dtype=np.int64))
+        remap = np.full(self.size, -1, dtype=np.int64)
+        remap[live_ids] = np.arange(len(live_ids))
+        keys = self.keys()[live_ids].copy()
+        self.size = len(keys)
+        self._keys[:self.size] = keys
+        self._rebuild(len(self._table))
+        return remap
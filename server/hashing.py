@@ -0,0 +1,103 @@
+import hashlib
+import numpy as np
+
+MAX_RANK = np.iinfo(np.uint32).max
+DEFAULT_SEED = 0x5EED5EED
+
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+_MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_2 = np.uint64(0x94D049BB133111EB)
+
+
+def as_node_ids(values):
+    """Coerce a scalar, sequence or array of node IDs to a 1-D int64 array."""
+    ids = np.asarray(values)
+    if ids.ndim == 0:
+        ids = ids.reshape(1)
+    if ids.dtype != np.int64:
+        ids = ids.astype(np.int64)
+    return ids
+
+
+def mix64(x):
+    """splitmix64 finalizer applied element-wise to a uint64 array."""
+    x = np.array(x, dtype=np.uint64, copy=True)
+    x ^= x >> np.uint64(30)
+    x *= _MIX_1
+    x ^= x >> np.uint64(27)
+    x *= _MIX_2
+    x ^= x >> np.uint64(31)
+    return x
+
+
+class Mix64Hasher:
+    """
+    Seeded splitmix64 hash family. Every layer gets its own seed derived
+    from the base seed, so the coordinates only depend on (seed, node ID)
+    and are identical across processes and Python runs.
+    """
+    name = 'mix64'
+
+    def __init__(self, depth, width, seed=DEFAULT_SEED):
+        self.depth = depth
+        self.width = width
+        self.seed = seed
+        base = np.uint64(seed)
+        layers = np.arange(1, depth + 1, dtype=np.uint64)
+        self._layer_seeds = mix64(layers * _GOLDEN + base)
+        self._rank_seed = mix64(np.array([base ^ _GOLDEN], dtype=np.uint64))
+
+    def coords(self, ids):
+        keys = as_node_ids(ids).view(np.uint64)
+        h = mix64(keys[None, :] ^ self._layer_seeds[:, None])
+        return (h % np.uint64(self.width)).astype(np.int64)
+
+    def ranks(self, sources, dests):
+        s = as_node_ids(sources).view(np.uint64)
+        d = as_node_ids(dests).view(np.uint64)
+        h = mix64(mix64(s ^ self._rank_seed) ^ d)
+        return (h % np.uint64(MAX_RANK)).astype(np.uint32)
+
+
+class MD5Hasher:
+    """
+    The original MD5-based hashing, kept so sketches built with it can
+    still be queried. Each distinct node is hashed once per batch.
+    """
+    name = 'md5'
+
+    def __init__(self, depth, width, seed=None):
+        self.depth = depth
+        self.width = width
+        self.seed = 0
+
+    def coords(self, ids):
+        uniq, inverse = np.unique(as_node_ids(ids), return_inverse=True)
+        out = np.empty((self.depth, len(uniq)), dtype=np.int64)
+        for j, node in enumerate(uniq.tolist()):
+            for i in range(self.depth):
+                digest = hashlib.md5(f"{node}{i}".encode()).hexdigest()
+                out[i, j] = int(digest, 16) % self.width
+        return out[:, inverse.reshape(-1)]
+
+    def ranks(self, sources, dests):
+        pairs = zip(as_node_ids(sources).tolist(), as_node_ids(dests).tolist())
+        return np.fromiter(
+            (int(hashlib.md5(f"{s}-{d}".encode()).hexdigest(), 16) % MAX_RANK
+             for s, d in pairs),
+            dtype=np.uint32
+        )
+
+
+HASH_FAMILIES = {
+    Mix64Hasher.name: Mix64Hasher,
+    MD5Hasher.name: MD5Hasher,
+}
+
+
+def make_hasher(family, depth, width, seed=DEFAULT_SEED):
+    if family not in HASH_FAMILIES:
+        raise ValueError(
+            f"Unknown hash family {family!r}; expected one of {sorted(HASH_FAMILIES)}"
+        )
+    return HASH_FAMILIES[family](depth, width, seed)
@@ -0,0 +1,147 @@
+import numpy as np
+from hashing import as_node_ids
+from hash_index import unique_rows
+
+# Counters per summary when a client asks for top-k without choosing
+DEFAULT_COUNTERS = 1024
+
+
+class SpaceSaving:
+    """
+    Space-saving summary of the heaviest keys in a weighted stream, kept in
+    at most `capacity` counters. Keys are fixed-width int64 tuples. Counters
+    are stored sorted by count, heaviest first, so top_k is a slice.
+
+    Every count is an upper bound on the key's true weight, and at most its
+    error above it. Batches and whole summaries are folded in with the
+    mergeable-summary rule: a key missing from one side is charged that
+    side's floor (its smallest count once full, else 0).
+    """
+    def __init__(self, capacity, key_width=1):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.key_width = key_width
+        self.keys = np.empty((0, key_width), dtype=np.int64)
+        self.counts = np.empty(0, dtype=np.float64)
+        self.errors = np.empty(0, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.counts)
+
+    @property
+    def floor(self):
+        return self.counts[-1] if len(self.counts) == self.capacity else 0.0
+
+    def _fold(self, keys, counts, errors, floor):
+        n = len(self.keys)
+        combined, _, inverse = unique_rows(np.concatenate([self.keys, keys]))
+        ours, theirs = inverse[:n], inverse[n:]
+        total = np.zeros(len(combined))
+        error = np.zeros(len(combined))
+        np.add.at(total, theirs, counts)
+        np.add.at(error, theirs, errors)
+        # Keys only we monitor are charged the other side's floor, keys only
+        # they monitor ours
+        only_ours = np.ones(len(combined), dtype=bool)
+        only_ours[theirs] = False
+        only_theirs = np.ones(len(combined), dtype=bool)
+        only_theirs[ours] = False
+        total[ours] += self.counts
+        error[ours] += self.errors
+        total[only_ours] += floor
+        error[only_ours] += floor
+        total[only_theirs] += self.floor
+        error[only_theirs] += self.floor
+
+        # Heaviest first; ties keep the older key
+        keep = np.argsort(-total, kind='stable')[:self.capacity]
+        self.keys = combined[keep]
+        self.counts = total[keep]
+        self.errors = error[keep]
+
+    def update(self, keys, weights):
+        """Fold in a batch of (key, weight) rows."""
+        keys = np.asarray(keys, dtype=np.int64).reshape(-1, self.key_width)
+        if len(keys) == 0:
+            return
+        uniq, _, inverse = unique_rows(keys)
+        totals = np.bincount(inverse, weights=weights, minlength=len(uniq))
+        self._fold(uniq, totals, np.zeros(len(uniq)), 0.0)
+
+    def merge(self, other):
+        """Fold in another summary of the same key width."""
+        if other.key_width != self.key_width:
+            raise ValueError("Cannot merge summaries with different key widths")
+        self._fold(other.keys, other.counts, other.errors, other.floor)
+
+    def top_k(self, k):
+        """(keys, counts, errors) of the k heaviest keys, heaviest first."""
+        return self.keys[:k], self.counts[:k], self.errors[:k]
+
+    def to_arrays(self):
+        return {'keys': self.keys, 'counts': self.counts, 'errors': self.errors}
+
+    @classmethod
+    def from_arrays(cls, arrays, capacity):
+        summary = cls(capacity, arrays['keys'].shape[1])
+        summary.keys = np.array(arrays['keys'], dtype=np.int64)
+        summary.counts = np.array(arrays['counts'], dtype=np.float64)
+        summary.errors = np.array(arrays['errors'], dtype=np.float64)
+        return summary
+
+
+class HeavyHitters:
+    """Space-saving summaries of the heaviest edges and node out/in weights."""
+    KINDS = ('edges', 'out', 'in')
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.summaries = {
+            'edges': SpaceSaving(capacity, key_width=2),
+            'out': SpaceSaving(capacity),
+            'in': SpaceSaving(capacity),
+        }
+
+    def update(self, sources, dests, weights):
+        sources = as_node_ids(sources)
+        dests = as_node_ids(dests)
+        self.summaries['edges'].update(np.stack([sources, dests], axis=1), weights)
+        self.summaries['out'].update(sources, weights)
+        self.summaries['in'].update(dests, weights)
+
+    def merge(self, other):
+        for kind in self.KINDS:
+            self.summaries[kind].merge(other.summaries[kind])
+
+    def top_k(self, kind, k):
+        if kind not in self.summaries:
+            raise ValueError(f"Unknown heavy hitter kind '{kind}' (expected one of {self.KINDS})")
+        return self.summaries[kind].top_k(k)
+
+    def report(self, k):
+        """JSON-ready top-k lists: [key..., weight, error] rows per kind."""
+        report = {}
+        for kind in self.KINDS:
+            keys, counts, errors = self.top_k(kind, k)
+            report[kind] = [
+                key + [count, error]
+                for key, count, error in zip(keys.tolist(), counts.tolist(), errors.tolist())
+            ]
+        return report
+
+    def to_arrays(self):
+        return {
+            f'{kind}.{name}': arr
+            for kind in self.KINDS
+            for name, arr in self.summaries[kind].to_arrays().items()
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays, capacity):
+        heavy = cls(capacity)
+        for kind in cls.KINDS:
+            prefix = f'{kind}.'
+            section = {name[len(prefix):]: arr for name, arr in arrays.items() if name.startswith(prefix)}
+            heavy.summaries[kind] = SpaceSaving.from_arrays(section, capacity)
+        return heavy
@@ -0,0 +1,121 @@
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+KERNELS = ('auto', 'numba', 'numpy')
+
+
+def resolve_kernel(kernel):
+    """The update kernel to use: 'auto' picks numba whenever it is importable."""
+    if kernel not in KERNELS:
+        raise ValueError(f"Unknown kernel '{kernel}' (expected one of {KERNELS})")
+    if kernel == 'auto':
+        return 'numba' if njit is not None else 'numpy'
+    if kernel == 'numba' and njit is None:
+        raise ValueError("The numba kernel needs numba installed")
+    return kernel
+
+
+def _apply_rows(cells, keys, slot_ids, weights, rank_key, weight, slots):
+    """
+    The rank-min / tie-accumulate rule row by row, in arrival order, on the
+    storage arrays in place. Touched cells are found through a small
+    open-addressing table sized to the batch. Every cell keeps a float64
+    sum of its batch contributions and is rounded to float32 once, as
+    float32(base + added), the way the vectorized path does it.
+
+    Returns, per touched cell in first-touch order: its id, rank key,
+    weight and list length before the batch, and whether it was reset;
+    then the number of rows at their cell's final rank and the number of
+    those left out of a full list.
+    """
+    n = len(cells)
+    limit = slots.shape[1]
+    size = 16
+    while size < 2 * n:
+        size *= 2
+    mask = size - 1
+    table = np.full(size, -1, dtype=np.int64)
+    touched = np.empty(n, dtype=np.int64)
+    initial_rank = np.empty(n, dtype=rank_key.dtype)
+    initial_weight = np.empty(n, dtype=weight.dtype)
+    initial_count = np.empty(n, dtype=np.int64)
+    reset = np.zeros(n, dtype=np.bool_)
+    base = np.empty(n, dtype=np.float64)
+    added = np.empty(n, dtype=np.float64)
+    hits = np.zeros(n, dtype=np.int64)
+    misses = np.zeros(n, dtype=np.int64)
+    m = 0
+
+    for r in range(n):
+        c = cells[r]
+        k = keys[r]
+        if k < rank_key[c]:
+            continue
+        p = ((c ^ (c >> 17)) * 0x2545F491) & mask
+        while table[p] >= 0 and touched[table[p]] != c:
+            p = (p + 1) & mask
+        i = table[p]
+        if i < 0:
+            i = m
+            m += 1
+            table[p] = i
+            touched[i] = c
+            initial_rank[i] = rank_key[c]
+            initial_weight[i] = weight[c]
+            count = 0
+            while count < limit and slots[c, count] != 0:
+                count += 1
+            initial_count[i] = count
+            base[i] = weight[c]
+            added[i] = 0.0
+        if k > rank_key[c]:
+            rank_key[c] = k
+            for j in range(limit):
+                slots[c, j] = 0
+            reset[i] = True
+            base[i] = 0.0
+            added[i] = 0.0
+            hits[i] = 0
+            misses[i] = 0
+        hits[i] += 1
+        s = slot_ids[r]
+        j = 0
+        while j < limit and slots[c, j] != 0 and slots[c, j] != s:
+            j += 1
+        if j == limit:
+            misses[i] += 1
+            continue
+        slots[c, j] = s
+        added[i] += weights[r]
+
+    for i in range(m):
+        weight[touched[i]] = base[i] + added[i]
+    return (touched[:m], initial_rank[:m], initial_weight[:m], initial_count[:m], reset[:m],
+            hits[:m].sum(), misses[:m].sum())
+
+
+if njit is not None:
+    _apply_rows = njit(cache=True, nogil=True)(_apply_rows)
+
+
+def apply_rows(storage, cells, keys, slot_ids, weights):
+    """
+    Run the compiled kernel over a batch of (cell, rank key, slot id,
+    weight) rows against storage. Results are those of _apply_rows, with
+    the touched cells sorted by id.
+    """
+    result = _apply_rows(
+        np.asarray(cells, dtype=np.int64),
+        np.asarray(keys, dtype=storage.rank_key.dtype),
+        np.asarray(slot_ids, dtype=storage.slots.dtype),
+        np.asarray(weights, dtype=np.float64),
+        np.asarray(storage.rank_key),
+        np.asarray(storage.weight),
+        np.asarray(storage.slots),
+    )
+    order = np.argsort(result[0], kind='stable')
+    return tuple(arr[order] for arr in result[:5]) + result[5:]
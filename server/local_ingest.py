@@ -0,0 +1,91 @@
+import os
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from prb_sketch import PRBSketch
+from edge_reader import DEFAULT_CHUNK_BYTES, sketch_file
+from metrics import REGISTRY
+
+
+def split_ranges(file_path, parts):
+    """
+    Cut a file into `parts` contiguous byte ranges. Ranges need not fall on
+    line boundaries: a line belongs to the range its first byte lies in.
+    """
+    size = os.path.getsize(file_path)
+    bounds = np.linspace(0, size, max(parts, 1) + 1).astype(np.int64)
+    return [(int(start), int(end)) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+
+def shard_params(sketch):
+    """Constructor arguments for shards that can be merged into sketch."""
+    return {
+        'width': sketch.width,
+        'depth': sketch.depth,
+        'conflict_limit': sketch.conflict_limit,
+        'hash_family': sketch.hash_family,
+        'seed': sketch.seed,
+        'heavy_hitters': sketch.heavy_hitters,
+        'deletions': sketch.deletions,
+        'kernel': sketch.kernel,
+    }
+
+
+def init_worker():
+    """
+    Pool initializer. Forked workers start with a copy of the parent's
+    metrics, which must not be drained back into the parent a second time.
+    """
+    REGISTRY.drain()
+
+
+def build_shard(file_path, start, end, params, chunk_bytes):
+    """
+    Sketch one byte range of an edge file into its own sparse shard.
+    Returns the shard, its edge count and the worker's drained metrics.
+    """
+    shard = PRBSketch(storage='sparse', **params)
+    count = sketch_file(shard, file_path, start, end, chunk_bytes)
+    return shard, count, REGISTRY.drain()
+
+
+class LocalIngestEngine:
+    """
+    Sketches an edge file on the local cores without Spark. The file is split
+    into byte ranges, every range is parsed and sketched by a worker process,
+    and the shards are merged into the target sketch in file order.
+    """
+    def __init__(self, workers=None, chunk_bytes=DEFAULT_CHUNK_BYTES):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_bytes = chunk_bytes
+
+    def ingest(self, file_path, sketch, progress=None, lock=None):
+        """
+        Merge every edge of file_path into sketch and return the edge count.
+        progress(shard_index, edge_count) is called after each shard merges.
+        lock, if given, is held while sketch changes, so other threads can
+        read it in between.
+        """
+        if self.workers == 1:
+            count = sketch_file(sketch, file_path, chunk_bytes=self.chunk_bytes, lock=lock)
+            if progress:
+                progress(0, count)
+            return count
+
+        params = shard_params(sketch)
+        ranges = split_ranges(file_path, self.workers)
+        total = 0
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker) as pool:
+            futures = [
+                pool.submit(build_shard, file_path, start, end, params, self.chunk_bytes)
+                for start, end in ranges
+            ]
+            for index, future in enumerate(futures):
+                shard, count, metrics = future.result()
+                REGISTRY.absorb(metrics)
+                with lock or nullcontext():
+                    sketch.merge(shard)
+                total += count
+                if progress:
+                    progress(index, count)
+        return total
@@ -0,0 +1,188 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram bucket i holds observations below 2**i nanoseconds
+_BUCKETS = 48
+
+
+class Counter:
+    """A monotonically increasing count of events."""
+    def __init__(self, name, help=''):
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+    def drain(self):
+        value, self.value = self.value, 0
+        return value
+
+    def absorb(self, value):
+        self.value += value
+
+
+class Histogram:
+    """
+    Latency histogram over power-of-two nanosecond buckets, so observing is
+    an int conversion, a bit_length and a list increment. Quantiles are
+    reported as the upper bound of the bucket they fall in, i.e. to within
+    a factor of two.
+    """
+    def __init__(self, name, help=''):
+        self.name = name
+        self.help = help
+        self.buckets = [0] * _BUCKETS
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.buckets[min(int(seconds * 1e9).bit_length(), _BUCKETS - 1)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def time(self, per=1):
+        """Context manager observing the elapsed time of its block, divided by `per`."""
+        return _Timer(self, per)
+
+    def quantile(self, q):
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return (1 << i) / 1e9
+        return (1 << (_BUCKETS - 1)) / 1e9
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+        }
+
+    def drain(self):
+        state = (self.buckets, self.count, self.sum)
+        self.buckets, self.count, self.sum = [0] * _BUCKETS, 0, 0.0
+        return state
+
+    def absorb(self, state):
+        buckets, count, total = state
+        self.buckets = [a + b for a, b in zip(self.buckets, buckets)]
+        self.count += count
+        self.sum += total
+
+
+class _Timer:
+    def __init__(self, histogram, per):
+        self.histogram = histogram
+        self.per = per
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe((time.perf_counter() - self.start) / max(self.per, 1))
+
+
+class MetricsRegistry:
+    """
+    Named counters and histograms. Metrics are created once, normally at
+    import time, and the hot paths keep direct references to them. Updates
+    take no lock: at worst a race between threads loses an increment.
+    """
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric '{name}' is already registered as a {type(metric).__name__}")
+            return metric
+
+    def counter(self, name, help=''):
+        return self._get(Counter, name, help)
+
+    def histogram(self, name, help=''):
+        return self._get(Histogram, name, help)
+
+    def snapshot(self):
+        """JSON-ready values of every metric, by name."""
+        return {name: metric.snapshot() for name, metric in sorted(self._metrics.items())}
+
+    def drain(self):
+        """
+        Raw state of every metric, resetting it. Worker processes drain
+        their registry into the results they return, and the parent adds
+        it to its own with absorb, so their work shows up in its metrics.
+        """
+        return {name: (type(metric).__name__, metric.drain()) for name, metric in self._metrics.items()}
+
+    def absorb(self, drained):
+        for name, (kind, state) in drained.items():
+            cls = Counter if kind == 'Counter' else Histogram
+            self._get(cls, name, '').absorb(state)
+
+    def render_text(self):
+        """Every metric in the Prometheus text exposition format."""
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            if metric.help:
+                lines.append(f"# HELP {name} {metric.help}")
+            if isinstance(metric, Counter):
+                lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name} {metric.value}")
+                continue
+            lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for i, n in enumerate(metric.buckets):
+                cumulative += n
+                if n or i == _BUCKETS - 1:
+                    lines.append(f'{name}_bucket{{le="{(1 << i) / 1e9:.9g}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{le="+Inf"}} {metric.count}')
+            lines.append(f"{name}_sum {metric.sum:.9g}")
+            lines.append(f"{name}_count {metric.count}")
+        return "\n".join(lines) + "\n"
+
+
+# The process-wide registry the sketch and the servers report to
+REGISTRY = MetricsRegistry()
+
+
+def serve_metrics(port, host='localhost', registry=REGISTRY):
+    """
+    Serve registry.render_text() at http://host:port/metrics from a daemon
+    thread. Returns the HTTP server; call shutdown() on it to stop.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip('/') != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render_text().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
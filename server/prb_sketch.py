@@ -1,6 +1,44 @@
 import numpy as np
-import hashlib
 import sys
+from hashing import MAX_RANK, DEFAULT_SEED, as_node_ids, make_hasher
+from hash_index import HashIndex, unique_rows
+from storage import make_storage
+from snapshot import read_snapshot, write_snapshot
+from dsu import ArrayDSU
+from connectivity import DynamicConnectivity
+from heavy_hitters import HeavyHitters
+from metrics import REGISTRY
+from kernels import apply_rows, resolve_kernel
+
+# Edges answered per pass by edge_query_many
+QUERY_CHUNK = 1 << 18
+
+_UPDATE_SECONDS = REGISTRY.histogram('sketch_update_seconds_per_edge', "update_batch time per edge")
+_HASH_SECONDS = REGISTRY.histogram('sketch_hash_seconds_per_edge', "hash_batch time per edge")
+_EDGES = REGISTRY.counter('sketch_edges_total', "Edges passed to update_batch")
+_EVICTIONS = REGISTRY.counter('sketch_evictions_total', "Occupied cells reset by an edge of lower rank")
+_TIES = REGISTRY.counter('sketch_ties_total', "Edges arriving at a cell holding their rank")
+_OVERFLOWS = REGISTRY.counter('sketch_overflows_total', "Edges left out of a full conflict list")
+_EDGE_QUERY_SECONDS = REGISTRY.histogram('sketch_edge_query_seconds', "edge_query_many call latency")
+_EDGE_QUERIES = REGISTRY.counter('sketch_edge_queries_total', "Edges estimated by edge_query_many")
+_REACH_SECONDS = REGISTRY.histogram('sketch_reachability_seconds', "reachability_many call latency")
+_REACH_QUERIES = REGISTRY.counter('sketch_reachability_queries_total', "Pairs checked by reachability_many")
+
+
+def _run_heads(*columns):
+    """Mask of the rows starting a new run of equal values in sorted columns."""
+    heads = np.zeros(len(columns[0]), dtype=bool)
+    heads[:1] = True
+    for col in columns:
+        heads[1:] |= col[1:] != col[:-1]
+    return heads
+
+
+def _run_offsets(heads):
+    """Offset of every row from the head of its run."""
+    idx = np.arange(len(heads))
+    return idx - np.maximum.accumulate(np.where(heads, idx, 0))
+
 
 class PRBSketch:
     """
@@ -8,139 +46,682 @@ class PRBSketch:
     using a Rank-based mechanism for edge weight estimation and an
     integrated Disjoint Set Union (DSU) for connectivity queries.
     """
-    def __init__(self, width, depth, conflict_limit=3):
+    def __init__(self, width, depth, conflict_limit=3, hash_family='mix64', seed=DEFAULT_SEED,
+                 storage='dense', heavy_hitters=0, deletions=False, kernel='auto'):
+        if conflict_limit < 1:
+            raise ValueError("conflict_limit must be at least 1")
         # --- Parameters for the Sketch ---
         self.width = width
         self.depth = depth
         self.conflict_limit = conflict_limit
-        self.max_rank = np.iinfo(np.uint32).max
-        self.gM = np.zeros((depth, width, width), dtype=[
-            ('rank', 'u4'), 
-            ('weight', 'f4'), 
-            ('list', 'O')
-        ])
-        self.gM['rank'] = self.max_rank
-        for i in range(depth):
-            for j in range(width):
-                for k in range(width):
-                    self.gM[i, j, k]['list'] = []
-        
-        # --- NEW: Initialize DSU Data Structures ---
-        self.dsu_parent = {}
-        self.dsu_rank = {}
-
-    # --- NEW: DSU 'find' operation with path compression ---
-    def _dsu_find(self, i):
-        # If node is new, it becomes its own parent
-        if i not in self.dsu_parent:
-            self.dsu_parent[i] = i
-            self.dsu_rank[i] = 0
-            return i
+        self.max_rank = MAX_RANK
+        # 'md5' reproduces the original per-edge MD5 coordinates and ranks
+        self.hasher = make_hasher(hash_family, depth, width, seed)
+        self.hash_family = self.hasher.name
+        self.seed = self.hasher.seed
+        # Cell ranks, weights and conflict lists live in flat arrays; the
+        # conflict lists hold ids of (source, dest) pairs interned in self.edges.
+        # 'sparse' only keeps occupied cells, for widths where width^2 won't fit.
+        self.storage = make_storage(storage, depth, width, conflict_limit)
+        self.edges = HashIndex(key_width=2)
+        self._compact_edges_at = 1024
+        # Cell updates run in a compiled numba loop when it is importable,
+        # and through the vectorized NumPy path otherwise
+        self.kernel = resolve_kernel(kernel)
         
-        # Path compression
-        if self.dsu_parent[i] == i:
-            return i
-        self.dsu_parent[i] = self._dsu_find(self.dsu_parent[i])
-        return self.dsu_parent[i]
-
-    # --- NEW: DSU 'union' operation by rank ---
-    def _dsu_union(self, i, j):
-        root_i = self._dsu_find(i)
-        root_j = self._dsu_find(j)
-        
-        if root_i != root_j:
-            if self.dsu_rank[root_i] < self.dsu_rank[root_j]:
-                self.dsu_parent[root_i] = root_j
-            elif self.dsu_rank[root_i] > self.dsu_rank[root_j]:
-                self.dsu_parent[root_j] = root_i
-            else:
-                self.dsu_parent[root_j] = root_i
-                self.dsu_rank[root_i] += 1
+        # Connectivity is tracked by a DSU over interned node indices. With
+        # deletions, the DSU holds the components of a live edge table's
+        # spanning forest, which can split again when edges are deleted.
+        self.deletions = deletions
+        self.connectivity = DynamicConnectivity() if deletions else None
+        self.dsu = self.connectivity.dsu if deletions else ArrayDSU()
+        self._listeners = []
+
+        # Top-k heaviest edges and nodes, in `heavy_hitters` counters each
+        self.heavy_hitters = heavy_hitters
+        self.heavy = HeavyHitters(heavy_hitters) if heavy_hitters else None
+
+        # Running totals behind get_stats, adjusted on every cell write
+        self._occupied = 0
+        self._stored_edges = 0
+        self._total_weight = 0.0
+
+    @property
+    def nbytes(self):
+        """Bytes held by the cells, the edge interner and the connectivity structure."""
+        links = self.connectivity.nbytes if self.connectivity is not None else self.dsu.nbytes
+        return self.storage.nbytes + self.edges.nbytes + links
+
+    def add_listener(self, listener):
+        """
+        Register listener(cells, nodes). It is called after every update or
+        merge with the storage ids of the cells written and the DSU node
+        indices whose entries were created or re-linked.
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self._listeners.remove(listener)
+
+    def _notify(self, cells, nodes):
+        for listener in self._listeners:
+            listener(cells, nodes)
+
+    def hash_batch(self, sources, dests):
+        """
+        Hash a whole batch of edges in one vectorized pass. Returns the
+        (depth, n) row and column coordinates and the (n,) edge ranks.
+        """
+        with _HASH_SECONDS.time(per=len(sources)):
+            xs = self.hasher.coords(sources)
+            ys = self.hasher.coords(dests)
+            ranks = self.hasher.ranks(sources, dests)
+        return xs, ys, ranks
 
     def _get_hashes_and_rank(self, source, dest):
-        edge_str = f"{source}-{dest}"
-        rank_hash = hashlib.md5(edge_str.encode()).hexdigest()
-        rank = int(rank_hash, 16) % self.max_rank
-
-        coords = []
-        for i in range(self.depth):
-            seed_s = f"{source}{i}"
-            seed_d = f"{dest}{i}"
-            hash_s = int(hashlib.md5(seed_s.encode()).hexdigest(), 16) % self.width
-            hash_d = int(hashlib.md5(seed_d.encode()).hexdigest(), 16) % self.width
-            coords.append((hash_s, hash_d))
-            
-        return coords, rank
+        xs, ys, ranks = self.hash_batch([source], [dest])
+        coords = list(zip(xs[:, 0].tolist(), ys[:, 0].tolist()))
+        return coords, int(ranks[0])
 
     def update(self, edges):
-        for row in edges:
-            source = str(row.source)
-            dest = str(row.dest)
-            weight = float(row.weight)
-            
-            # --- MODIFIED: Update DSU with every edge ---
-            self._dsu_union(source, dest)
-            
-            # --- Unchanged sketch update logic ---
-            coords, new_rank = self._get_hashes_and_rank(source, dest)
-            edge_tuple = (source, dest)
-
-            for i in range(self.depth):
-                x, y = coords[i]
-                cell = self.gM[i, x, y]
-                cell_rank = cell['rank']
-
-                if new_rank < cell_rank:
-                    cell['rank'] = new_rank
-                    cell['weight'] = weight
-                    cell['list'] = [edge_tuple]
-                elif new_rank == cell_rank:
-                    if edge_tuple not in cell['list']:
-                         if len(cell['list']) < self.conflict_limit:
-                            cell['weight'] += weight
-                            cell['list'].append(edge_tuple)
-                    else:
-                        cell['weight'] += weight
+        edges = list(edges)
+        if not edges:
+            return
+        self.update_batch(
+            [row.source for row in edges],
+            [row.dest for row in edges],
+            [row.weight for row in edges]
+        )
+
+    def _account(self, cells, sign):
+        """Add (sign 1) or withdraw (sign -1) the given cells' share of the stats totals."""
+        st = self.storage
+        self._occupied += sign * int(np.count_nonzero(st.rank_key[cells]))
+        self._stored_edges += sign * int(np.count_nonzero(st.slots[cells]))
+        self._total_weight += sign * float(st.weight[cells].sum(dtype=np.float64))
+
+    def _recount(self):
+        self._occupied = self._stored_edges = 0
+        self._total_weight = 0.0
+        self._account(self.storage.occupied(), 1)
+
+    def _cell_keys(self, xs, ys):
+        layers = np.arange(self.depth)[:, None]
+        return (layers * self.width + xs) * self.width + ys
+
+    def update_batch(self, sources, dests, weights=None):
+        """
+        Add a batch of weighted edges. On a sketch built with deletions=True
+        weights may be negative: the batch is summed per (source, dest) pair
+        into the pair's net weight, and the cells are moved from the pair's
+        old net weight to the new one, dropping pairs that reach zero.
+        """
+        sources = as_node_ids(sources)
+        dests = as_node_ids(dests)
+        if weights is None:
+            weights = np.ones(len(sources), dtype=np.float64)
+        else:
+            weights = np.asarray(weights, dtype=np.float64)
+        if len(sources) == 0:
+            return
+        if self.connectivity is None and (weights < 0).any():
+            raise ValueError("Negative weights need a sketch built with deletions=True")
+        with _UPDATE_SECONDS.time(per=len(sources)):
+            self._update(sources, dests, weights)
+        _EDGES.inc(len(sources))
+
+    def _update(self, sources, dests, weights):
+        if self.connectivity is not None:
+            pairs, _, inverse = unique_rows(np.stack([sources, dests], axis=1))
+            deltas = np.bincount(inverse, weights=weights, minlength=len(pairs))
+            before, after, linked = self.connectivity.apply(pairs, deltas)
+            if self.heavy:
+                self.heavy.update(sources, dests, weights)
+            self._notify(self._settle(pairs, np.maximum(before, 0), after), linked)
+            return
+
+        # --- MODIFIED: Update DSU with every edge ---
+        linked = self.dsu.union_many(sources, dests)
+        if self.heavy:
+            self.heavy.update(sources, dests, weights)
+        self._notify(self._insert_cells(sources, dests, weights), linked)
+
+    def _insert_cells(self, sources, dests, weights):
+        """Write a batch of edges into their cells; returns the cells written."""
+        xs, ys, ranks = self.hash_batch(sources, dests)
+        cells = self.storage.locate(self._cell_keys(xs, ys), create=True)
+
+        base = self.edges.size
+        slot_ids, fresh_pairs = self._slot_ids(np.stack([sources, dests], axis=1))
+
+        touched = self._apply_cells(
+            cells.ravel(),
+            np.tile(self.max_rank - ranks, self.depth),
+            np.tile(slot_ids, self.depth),
+            np.tile(weights, self.depth)
+        )
+        self._intern_admitted(touched, base, fresh_pairs)
+        return touched
+
+    def _settle(self, pairs, held, after):
+        """
+        Bring the cells of distinct (source, dest) pairs in line with their
+        net weights: held is the weight each pair currently contributes to
+        its cells and after its net weight now. Pairs that gained are
+        inserted with the difference, pairs that lost are retracted by it,
+        and pairs at or below zero are dropped. Returns the cells written.
+        """
+        target = np.maximum(after, 0)
+        grow = target > held
+        shrink = target < held
+        touched = [np.empty(0, dtype=np.int64)]
+        if grow.any():
+            touched.append(self._insert_cells(pairs[grow, 0], pairs[grow, 1], (target - held)[grow]))
+        if shrink.any():
+            touched.append(self._retract_cells(pairs[shrink], (target - held)[shrink], after[shrink] <= 0))
+        return np.unique(np.concatenate(touched))
+
+    def _retract_cells(self, pairs, deltas, drop):
+        """
+        Take weight back out of the cells listing the given pairs: each
+        pair's (negative) delta is added to every cell holding its rank and
+        id, and pairs marked in drop leave those conflict lists. A cell whose
+        list empties is cleared, so an edge of any rank can claim it again.
+        Returns the cells written.
+        """
+        edge_ids = self.edges.lookup(pairs)
+        known = np.flatnonzero(edge_ids >= 0)
+        if len(known) == 0:
+            return known
+        pairs, deltas, drop = pairs[known], deltas[known], drop[known]
+        slot_ids = (edge_ids[known] + 1).astype(np.uint32)
+
+        st = self.storage
+        xs, ys, ranks = self.hash_batch(pairs[:, 0], pairs[:, 1])
+        cells = st.locate(self._cell_keys(xs, ys))
+        held = cells >= 0
+        safe = np.where(held, cells, 0)
+        position = st.slots[safe] == slot_ids[:, None]
+        match = held & (st.rank_key[safe] == self.max_rank - ranks) & position.any(axis=2)
+        layer, row = np.nonzero(match)
+        if len(row) == 0:
+            return row
+        targets, inverse = np.unique(cells[layer, row], return_inverse=True)
+
+        lists = st.slots[targets]
+        dropped = drop[row]
+        column = position[layer, row].argmax(axis=1)
+        lists[inverse[dropped], column[dropped]] = 0
+        # Close the gaps, keeping the remaining edges in arrival order
+        lists = np.take_along_axis(lists, np.argsort(lists == 0, axis=1, kind='stable'), axis=1)
+        empty = ~lists.any(axis=1)
+        weight = st.weight[targets] + np.bincount(inverse, weights=deltas[row], minlength=len(targets))
+        weight = np.where(empty, 0.0, np.maximum(weight, 0.0))
+
+        self._account(targets, -1)
+        st.rank_key[targets] = np.where(empty, 0, st.rank_key[targets])
+        st.weight[targets] = weight.astype(np.float32)
+        st.slots[targets] = lists
+        self._account(targets, 1)
+        return targets
+
+    def _slot_ids(self, pairs):
+        """
+        Slot ids (edge id + 1) for (source, dest) pairs. Edges not interned
+        yet get provisional ids above every real one, numbered by first
+        appearance; only those that end up in a conflict list are interned
+        afterwards by _intern_admitted. Returns (slot_ids, fresh_pairs).
+        """
+        edge_ids = self.edges.lookup(pairs)
+        fresh = edge_ids < 0
+        fresh_pairs, _, fresh_local = unique_rows(pairs[fresh])
+        edge_ids[fresh] = self.edges.size + fresh_local
+        return (edge_ids + 1).astype(np.uint32), fresh_pairs
+
+    def _apply_cells(self, cells, keys, slot_ids, weights):
+        """
+        Apply the rank-min / tie-accumulate rule to a batch of
+        (cell, rank key, slot id, weight) rows given in arrival order, with
+        the same outcome as feeding them to the cells one at a time:
+
+        - a strictly lower rank (higher key) resets the cell to that edge,
+        - an equal rank adds the weight of edges already listed and appends
+          new edges while fewer than conflict_limit are listed,
+        - anything else is ignored.
+
+        Returns the ids of the cells that were written.
+        """
+        if self.kernel == 'numba':
+            return self._apply_cells_compiled(cells, keys, slot_ids, weights)
+        st = self.storage
+        limit = self.conflict_limit
+        arrival = np.arange(len(cells))
+        live = keys >= st.rank_key[cells]
+        cells, keys = cells[live], keys[live]
+        slot_ids, weights, arrival = slot_ids[live], weights[live], arrival[live]
+        if len(cells) == 0:
+            return cells
+
+        # Group rows by cell, best key first, then by arrival. Only rows
+        # carrying their cell's best key can influence the final state.
+        order = np.lexsort((arrival, ~keys, cells))
+        cells, keys = cells[order], keys[order]
+        slot_ids, weights = slot_ids[order], weights[order]
+        heads = _run_heads(cells)
+        group = np.cumsum(heads) - 1
+        targets = cells[heads]
+        best = keys[heads]
+        win = keys == best[group]
+        group, slot_ids, weights = group[win], slot_ids[win], weights[win]
+
+        reset = best > st.rank_key[targets]
+        _EVICTIONS.inc(int(np.count_nonzero(reset & (st.rank_key[targets] != 0))))
+        # Rows at their cell's rank beyond the one that set it
+        _TIES.inc(len(group) - int(np.count_nonzero(reset)))
+        lists = st.slots[targets]
+        lists[reset] = 0
+        counts = np.count_nonzero(lists, axis=1)
+        listed = (lists[group] == slot_ids[:, None]).any(axis=1)
+
+        # First arrival of each new (cell, edge) pair, in arrival order per cell
+        candidates = np.flatnonzero(~listed)
+        by_pair = candidates[np.lexsort((slot_ids[candidates], group[candidates]))]
+        pair_heads = _run_heads(group[by_pair], slot_ids[by_pair])
+        firsts = np.sort(by_pair[pair_heads])
+        first_group = group[firsts]
+        position = counts[first_group] + _run_offsets(_run_heads(first_group))
+        admit = position < limit
+
+        # Every arrival of an admitted edge counts towards the cell weight
+        contributes = listed.copy()
+        pair_first = by_pair[pair_heads][np.cumsum(pair_heads) - 1]
+        contributes[by_pair] = admit[np.searchsorted(firsts, pair_first)]
+        _OVERFLOWS.inc(len(group) - int(np.count_nonzero(contributes)))
+        added = np.bincount(group[contributes], weights=weights[contributes], minlength=len(targets))
+
+        lists[first_group[admit], position[admit]] = slot_ids[firsts[admit]]
+        base_weight = np.where(reset, 0.0, st.weight[targets].astype(np.float64))
+        self._account(targets, -1)
+        st.rank_key[targets] = best
+        st.weight[targets] = (base_weight + added).astype(np.float32)
+        st.slots[targets] = lists
+        self._account(targets, 1)
+        return targets
+
+    def _apply_cells_compiled(self, cells, keys, slot_ids, weights):
+        """_apply_cells through the compiled kernel, which writes storage in place."""
+        targets, rank_key, weight, count, reset, hits, misses = apply_rows(
+            self.storage, cells, keys, slot_ids, weights)
+        _EVICTIONS.inc(int(np.count_nonzero(reset & (rank_key != 0))))
+        _TIES.inc(int(hits) - int(np.count_nonzero(reset)))
+        _OVERFLOWS.inc(int(misses))
+        # Withdraw the cells' stats as they were before the kernel ran
+        self._occupied -= int(np.count_nonzero(rank_key))
+        self._stored_edges -= int(count.sum())
+        self._total_weight -= float(weight.sum(dtype=np.float64))
+        self._account(targets, 1)
+        return targets
+
+    def _intern_admitted(self, touched, base, fresh_pairs):
+        """Swap provisional slot ids in the touched cells for interned ones."""
+        lists = self.storage.slots[touched]
+        provisional = lists > base
+        if provisional.any():
+            local = np.unique(lists[provisional]).astype(np.int64) - 1 - base
+            interned = self.edges.intern(fresh_pairs[local])
+            lists[provisional] = interned[np.searchsorted(local, lists[provisional].astype(np.int64) - 1 - base)] + 1
+            self.storage.slots[touched] = lists
+        if self.edges.size >= self._compact_edges_at:
+            self._compact_edges()
+
+    def _compact_edges(self):
+        """
+        Forget interned edges that no longer sit in any conflict list.
+        Runs whenever the interner doubles, so its cost is amortized.
+        """
+        st = self.storage
+        occupied = st.occupied()
+        lists = st.slots[occupied]
+        live = np.unique(lists[lists != 0]).astype(np.int64) - 1
+        if 2 * len(live) < self.edges.size:
+            remap = np.r_[0, self.edges.compact(live) + 1].astype(np.uint32)
+            st.slots[occupied] = remap[lists]
+        self._compact_edges_at = 2 * max(self.edges.size, 512)
+
+    def merge(self, other):
+        """
+        Fold another sketch built with the same parameters into this one.
+        Cell-wise, the lower rank wins outright; on equal ranks the other
+        cell's edges are appended behind ours up to conflict_limit and its
+        weight is added in proportion to the edges that were kept, which is
+        exact unless the combined list overflows. DSU forests are unioned.
+        Returns self, so shards can be folded with functools.reduce.
+        """
+        for attr in ('width', 'depth', 'conflict_limit', 'hash_family', 'seed', 'heavy_hitters', 'deletions'):
+            if getattr(self, attr) != getattr(other, attr):
+                raise ValueError(f"Cannot merge sketches with different {attr}")
+        if self.heavy:
+            self.heavy.merge(other.heavy)
+
+        if self.connectivity is not None:
+            # Net weights add up across shards, so a deletion seen by one
+            # cancels an insertion seen by the other
+            live = self.connectivity.merge(other.connectivity)
+            linked = live[-1]
+        else:
+            # Linking every node of the other forest to its root reproduces
+            # its components here
+            live = None
+            theirs = np.arange(len(other.dsu))
+            linked = self.dsu.union_many(other.dsu.node_ids(theirs), other.dsu.node_ids(other.dsu.find(theirs)))
+
+        src = other.storage
+        occupied = src.occupied()
+        if len(occupied) == 0:
+            self._notify(self._settle_merged(live, occupied), linked)
+            return self
+        keys = src.rank_key[occupied]
+        weights = src.weight[occupied]
+        incoming = src.slots[occupied]
+
+        # Re-express the other sketch's edge ids in our interner
+        base = self.edges.size
+        listed = incoming != 0
+        slot_ids, fresh_pairs = self._slot_ids(other.edges.keys()[incoming[listed].astype(np.int64) - 1])
+        incoming = incoming.copy()
+        incoming[listed] = slot_ids
+
+        st = self.storage
+        cells = st.locate(src.cell_keys(occupied), create=True)
+        current = st.rank_key[cells]
+        lists = st.slots[cells]
+        new_weight = st.weight[cells].astype(np.float64)
+
+        take = keys > current
+        lists[take] = incoming[take]
+        new_weight[take] = weights[take]
+
+        tie = np.flatnonzero(keys == current)
+        ours, theirs = lists[tie], incoming[tie]
+        filled = np.count_nonzero(ours, axis=1)
+        kept = np.zeros(len(tie))
+        for col in range(self.conflict_limit):
+            slot = theirs[:, col]
+            present = slot != 0
+            known = (ours == slot[:, None]).any(axis=1) & present
+            admit = present & ~known & (filled < self.conflict_limit)
+            ours[admit, filled[admit]] = slot[admit]
+            filled += admit
+            kept += known | admit
+        share = kept / np.maximum(np.count_nonzero(theirs, axis=1), 1)
+        lists[tie] = ours
+        new_weight[tie] += weights[tie] * share
+
+        self._account(cells, -1)
+        st.rank_key[cells] = np.maximum(keys, current)
+        st.weight[cells] = new_weight.astype(np.float32)
+        st.slots[cells] = lists
+        self._account(cells, 1)
+        self._intern_admitted(cells, base, fresh_pairs)
+        self._notify(self._settle_merged(live, cells), linked)
+        return self
+
+    def _settle_merged(self, live, cells):
+        """
+        After a merge, retract pairs whose merged net weight is below what
+        the two sides' cells contributed for them. Returns every cell written.
+        """
+        if live is None:
+            return cells
+        pairs, before, after, _ = live
+        held = np.maximum(before, 0) + np.maximum(after - before, 0)
+        return np.union1d(cells, self._settle(pairs, held, after))
 
     def edge_query(self, source, dest):
-        source, dest = str(source), str(dest)
-        coords, query_rank = self._get_hashes_and_rank(source, dest)
-        min_weight = float('inf')
-        found = False
-        edge_tuple = (source, dest)
-
-        for i in range(self.depth):
-            x, y = coords[i]
-            cell = self.gM[i, x, y]
-
-            if cell['rank'] == query_rank and edge_tuple in cell['list']:
-                estimated_weight = cell['weight'] / len(cell['list']) if len(cell['list']) > 0 else 0
-                min_weight = min(min_weight, estimated_weight)
-                found = True
-        
-        return min_weight if found else 0.0
+        return float(self.edge_query_many([source], [dest])[0])
+
+    def edge_query_many(self, sources, dests):
+        """
+        Estimated weights of a batch of edges as a float64 array: for every
+        edge, the smallest per-layer share of a cell holding its rank and id,
+        or 0 where no layer holds it. Large batches are answered in chunks
+        of QUERY_CHUNK edges to bound the temporaries.
+        """
+        sources = as_node_ids(sources)
+        dests = as_node_ids(dests)
+        if len(sources) != len(dests):
+            raise ValueError("sources and dests must have the same length")
+        result = np.zeros(len(sources))
+        with _EDGE_QUERY_SECONDS.time():
+            for start in range(0, len(sources), QUERY_CHUNK):
+                stop = start + QUERY_CHUNK
+                result[start:stop] = self._edge_estimates(sources[start:stop], dests[start:stop])
+        _EDGE_QUERIES.inc(len(sources))
+        return result
+
+    def _edge_estimates(self, sources, dests):
+        estimates = np.zeros(len(sources))
+        edge_ids = self.edges.lookup(np.stack([sources, dests], axis=1))
+        known = np.flatnonzero(edge_ids >= 0)
+        if len(known) == 0:
+            return estimates
+
+        st = self.storage
+        xs, ys, ranks = self.hash_batch(sources[known], dests[known])
+        # (depth, n) storage ids; a missing sparse cell is -1 and never matches
+        cells = st.locate(self._cell_keys(xs, ys))
+        held = cells >= 0
+        safe = np.where(held, cells, 0)
+        lists = st.slots[safe]
+        match = held & (st.rank_key[safe] == self.max_rank - ranks)
+        match &= (lists == (edge_ids[known] + 1)[:, None].astype(np.uint32)).any(axis=2)
+        counts = np.count_nonzero(lists, axis=2)
+        shares = np.full(cells.shape, np.inf)
+        shares[match] = st.weight[safe[match]] / counts[match]
+        best = shares.min(axis=0)
+        estimates[known] = np.where(np.isfinite(best), best, 0)
+        return estimates
 
     def reachability_query(self, source, dest):
         # --- REPLACED: Query path is now the DSU ---
         # This now checks for ANY path, not just a direct edge.
-        source, dest = str(source), str(dest)
-        
-        # If nodes have never been seen, they can't be connected.
-        if source not in self.dsu_parent or dest not in self.dsu_parent:
-            return False
-            
-        return self._dsu_find(source) == self._dsu_find(dest)
+        # Nodes that have never been seen can't be connected.
+        return bool(self.reachability_many([source], [dest])[0])
+
+    def reachability_many(self, sources, dests):
+        """Whether each (source, dest) pair is connected, as a bool array."""
+        with _REACH_SECONDS.time():
+            reachable = self.dsu.connected(sources, dests)
+        _REACH_QUERIES.inc(len(reachable))
+        return reachable
+
+    def _neighbours(self, node, outgoing):
+        """
+        Nodes adjacent to `node` and their estimated edge weights. Every
+        out-edge of a node lands in its row x = h(node) of each layer (every
+        in-edge in its column), so only depth * width cells are read; their
+        conflict lists are filtered down to edges that really touch `node`.
+        """
+        node_id = as_node_ids([node])
+        coord = self.hasher.coords(node_id)[:, 0]
+        layers = np.arange(self.depth)[:, None]
+        span = np.arange(self.width)[None, :]
+        if outgoing:
+            keys = (layers * self.width + coord[:, None]) * self.width + span
+        else:
+            keys = (layers * self.width + span) * self.width + coord[:, None]
+
+        st = self.storage
+        cells = st.locate(keys.ravel())
+        lists = st.slots[cells[cells >= 0]]
+        listed = np.unique(lists[lists != 0]).astype(np.int64) - 1
+        pairs = self.edges.keys()[listed]
+        # Colliding nodes share the row or column; keep only our edges
+        mine, other = (0, 1) if outgoing else (1, 0)
+        others = np.unique(pairs[pairs[:, mine] == node_id[0], other])
+        repeated = np.repeat(node_id, len(others))
+        if outgoing:
+            weights = self.edge_query_many(repeated, others)
+        else:
+            weights = self.edge_query_many(others, repeated)
+        found = weights > 0
+        return others[found], weights[found]
+
+    def successors(self, node):
+        """(dests, estimated weights) of the edges leaving node."""
+        return self._neighbours(node, outgoing=True)
+
+    def precursors(self, node):
+        """(sources, estimated weights) of the edges entering node."""
+        return self._neighbours(node, outgoing=False)
+
+    def node_out_weight(self, node):
+        """Estimated total weight of the edges leaving node."""
+        return float(self.successors(node)[1].sum())
+
+    def node_in_weight(self, node):
+        """Estimated total weight of the edges entering node."""
+        return float(self.precursors(node)[1].sum())
+
+    def top_k(self, kind='edges', k=10):
+        """
+        The k heaviest 'edges', 'out' (source) or 'in' (dest) nodes seen so
+        far, as (keys, weights, errors) arrays sorted heaviest first. Each
+        weight overestimates the true one by at most its error. O(k).
+        """
+        if self.heavy is None:
+            raise ValueError("Heavy hitter tracking is off; build the sketch with heavy_hitters > 0")
+        return self.heavy.top_k(kind, k)
+
+    def save(self, path):
+        """Write the sketch, its edge interner and DSU to a binary snapshot."""
+        meta = {
+            'width': self.width,
+            'depth': self.depth,
+            'conflict_limit': self.conflict_limit,
+            'hash_family': self.hash_family,
+            'seed': self.seed,
+            'storage': self.storage.name,
+            'compact_edges_at': self._compact_edges_at,
+            'heavy_hitters': self.heavy_hitters,
+            'deletions': self.deletions,
+            'occupied_cells': self._occupied,
+            'stored_edges': self._stored_edges,
+            'total_weight': self._total_weight,
+        }
+        arrays = {f'storage.{name}': arr for name, arr in self.storage.to_arrays().items()}
+        for name, arr in self.edges.to_arrays().items():
+            arrays[f'edges.{name}'] = arr
+        for name, arr in self.dsu.to_arrays().items():
+            arrays[f'dsu.{name}'] = arr
+        if self.heavy:
+            for name, arr in self.heavy.to_arrays().items():
+                arrays[f'heavy.{name}'] = arr
+        if self.connectivity is not None:
+            for name, arr in self.connectivity.to_arrays().items():
+                arrays[f'live.{name}'] = arr
+        write_snapshot(path, meta, arrays)
+
+    @classmethod
+    def load(cls, path, mmap_mode='c', kernel='auto'):
+        """
+        Open a snapshot written by save. The cell and interner arrays are
+        memory-mapped, so even a multi-GB sketch opens immediately and pages
+        in as queries touch it; with the default copy-on-write mode the
+        sketch can keep ingesting without modifying the file.
+        """
+        meta, arrays = read_snapshot(path, mmap_mode)
+        sketch = cls(
+            width=meta['width'],
+            depth=meta['depth'],
+            conflict_limit=meta['conflict_limit'],
+            hash_family=meta['hash_family'],
+            seed=meta['seed'],
+            storage=meta['storage'],
+            heavy_hitters=meta.get('heavy_hitters', 0),
+            deletions=meta.get('deletions', False),
+            kernel=kernel
+        )
+        sketch._compact_edges_at = meta['compact_edges_at']
+
+        def section(prefix):
+            return {name[len(prefix):]: arr for name, arr in arrays.items() if name.startswith(prefix)}
+
+        sketch.storage.restore(section('storage.'))
+        sketch.edges = HashIndex.from_arrays(section('edges.'))
+        if 'dsu.parent' in arrays and 'dsu.nodes' not in arrays:
+            sketch.dsu = ArrayDSU.from_arrays(section('dsu.'))
+        else:
+            # Snapshots from before the array DSU store raw (node, parent) pairs
+            sketch.import_dsu(section('dsu.'))
+        if sketch.heavy:
+            sketch.import_heavy(section('heavy.'))
+        if sketch.deletions:
+            sketch.connectivity = DynamicConnectivity.from_arrays(section('live.'), sketch.dsu)
+        if 'total_weight' in meta:
+            sketch._occupied = meta['occupied_cells']
+            sketch._stored_edges = meta['stored_edges']
+            sketch._total_weight = meta['total_weight']
+        else:
+            # Older snapshots lack the totals; counting them reads every cell
+            sketch._recount()
+        return sketch
+
+    def export_cells(self, cells):
+        """
+        Self-contained copy of the given storage cells: flat cell keys, rank
+        keys, weights and the listed (source, dest) pairs, independent of
+        this sketch's storage ids and edge interner.
+        """
+        st = self.storage
+        lists = st.slots[cells]
+        filled = lists != 0
+        edges = np.zeros(lists.shape + (2,), dtype=np.int64)
+        edges[filled] = self.edges.keys()[lists[filled].astype(np.int64) - 1]
+        return {
+            'keys': st.cell_keys(cells),
+            'rank_key': st.rank_key[cells],
+            'weight': st.weight[cells],
+            'edges': edges,
+            'filled': filled,
+        }
+
+    def import_cells(self, arrays):
+        """Overwrite cells with the contents of an export_cells result."""
+        st = self.storage
+        cells = st.locate(arrays['keys'], create=True)
+        filled = np.asarray(arrays['filled'], dtype=bool)
+        lists = np.zeros(filled.shape, dtype=np.uint32)
+        lists[filled] = self.edges.intern(arrays['edges'][filled]) + 1
+        self._account(cells, -1)
+        st.rank_key[cells] = arrays['rank_key']
+        st.weight[cells] = arrays['weight']
+        st.slots[cells] = lists
+        self._account(cells, 1)
+
+    def import_heavy(self, arrays):
+        """Replace the heavy-hitter summaries with ones from heavy.to_arrays."""
+        self.heavy = HeavyHitters.from_arrays(arrays, self.heavy_hitters)
+
+    def export_dsu(self, nodes=None):
+        """DSU entries of the given node indices (all by default), keyed by raw node ID."""
+        return self.dsu.export(nodes)
+
+    def import_dsu(self, arrays):
+        """Set DSU entries from an export_dsu result."""
+        self.dsu.restore(arrays)
 
     def get_stats(self):
-        occupied_cells = np.sum(self.gM['rank'] != self.max_rank)
+        # O(1): the totals are maintained as cells are written
+        occupied_cells = self._occupied
         total_cells = self.depth * self.width * self.width
-        total_edges = sum(len(cell['list']) for cell in self.gM.flatten() if cell['list'])
+        total_edges = self._stored_edges
         
         return {
             'hash_functions': self.depth,
             'total_edges': total_edges,
-            'total_weight': np.sum(self.gM['weight']),
+            'total_weight': self._total_weight,
             'occupied_cells': occupied_cells,
             'total_cells': total_cells,
             'occupancy_rate': occupied_cells / total_cells if total_cells > 0 else 0
-        }
\ No newline at end of file
+        }
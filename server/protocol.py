@@ -0,0 +1,159 @@
+import asyncio
+import json
+import struct
+import numpy as np
+
+# Every message is one frame: a fixed header, then `length` body bytes.
+# The header carries the message kind and how the body is encoded, so the
+# receiver can read a body straight into its final numpy array.
+HEADER = struct.Struct('<2sBBQ')
+MAGIC = b'PR'
+
+# Message kinds
+MSG_CONFIG = 1            # client -> server, JSON sketch/ingest config
+MSG_QUERIES = 2           # client -> server, int64 (source, dest) pairs, flattened
+MSG_EDGE_WEIGHTS = 3      # server -> client, float32 estimate per query pair
+MSG_REACHABILITY = 4      # server -> client, bool per query pair
+MSG_STATS = 5             # server -> client, JSON stats; closes a round of results
+MSG_ERROR = 6             # server -> client, JSON {'error': message}
+MSG_TOP_K = 7             # server -> client, JSON heavy hitters, see HeavyHitters.report
+MSG_METRICS = 8           # client -> server in place of a config asks for, and server -> client
+                          # answers with, a JSON snapshot of the metrics registry
+
+# Body encodings: JSON, or a raw little-endian array of the given dtype
+ENCODING_JSON = 0
+ARRAY_ENCODINGS = {1: np.dtype('<f4'), 2: np.dtype('|b1'), 3: np.dtype('<i8'), 4: np.dtype('<f8')}
+_ENCODING_OF = {dtype.str: encoding for encoding, dtype in ARRAY_ENCODINGS.items()}
+
+# Upper bound on the bytes moved by a single send or recv call
+CHUNK_BYTES = 1 << 20
+
+
+def _json_default(value):
+    # numpy scalars, as found in get_stats results
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _json_frame(kind, obj):
+    body = json.dumps(obj, default=_json_default).encode()
+    return HEADER.pack(MAGIC, kind, ENCODING_JSON, len(body)) + body
+
+
+def _array_frame(kind, arr):
+    """Header and body byte view of a 1-D array frame; the body is not copied."""
+    arr = np.ascontiguousarray(arr).ravel()
+    encoding = _ENCODING_OF.get(arr.dtype.newbyteorder('<').str)
+    if encoding is None:
+        raise ValueError(f"Cannot send arrays of dtype {arr.dtype}")
+    arr = arr.astype(ARRAY_ENCODINGS[encoding], copy=False)
+    return HEADER.pack(MAGIC, kind, encoding, arr.nbytes), memoryview(arr).cast('B')
+
+
+def _parse_header(header):
+    """(kind, dtype, length) of a frame header; dtype is None for JSON bodies."""
+    magic, kind, encoding, length = HEADER.unpack(header)
+    if magic != MAGIC or (encoding != ENCODING_JSON and encoding not in ARRAY_ENCODINGS):
+        raise ValueError("Malformed frame header")
+    dtype = ARRAY_ENCODINGS.get(encoding)
+    if dtype is not None and length % dtype.itemsize:
+        raise ValueError(f"Frame length {length} is not a multiple of {dtype}")
+    return kind, dtype, length
+
+
+def expected(kind, got, body):
+    """Body of a received frame that must be of the given kind."""
+    if got == MSG_ERROR:
+        raise RuntimeError(body['error'])
+    if got != kind:
+        raise ValueError(f"Expected message kind {kind}, got {got}")
+    return body
+
+
+def send_json(sock, kind, obj):
+    sock.sendall(_json_frame(kind, obj))
+
+
+def send_array(sock, kind, arr):
+    """Send a 1-D array as one frame, straight from its buffer."""
+    header, view = _array_frame(kind, arr)
+    sock.sendall(header)
+    for start in range(0, len(view), CHUNK_BYTES):
+        sock.sendall(view[start:start + CHUNK_BYTES])
+
+
+def send_error(sock, message):
+    send_json(sock, MSG_ERROR, {'error': message})
+
+
+def _recv_into(sock, view):
+    """Fill a byte view from the socket, at most CHUNK_BYTES per call."""
+    while len(view):
+        received = sock.recv_into(view, min(len(view), CHUNK_BYTES))
+        if received == 0:
+            raise EOFError("Connection closed")
+        view = view[received:]
+
+
+def recv_frame(sock):
+    """
+    Read one frame and return (kind, body): a dict for JSON bodies, a 1-D
+    numpy array otherwise. Raises EOFError when the peer has closed.
+    """
+    header = bytearray(HEADER.size)
+    _recv_into(sock, memoryview(header))
+    kind, dtype, length = _parse_header(header)
+    if dtype is None:
+        body = bytearray(length)
+        _recv_into(sock, memoryview(body))
+        return kind, json.loads(body)
+    body = np.empty(length // dtype.itemsize, dtype=dtype)
+    _recv_into(sock, memoryview(body).cast('B'))
+    return kind, body
+
+
+def expect_frame(sock, kind):
+    """Read one frame that must be of the given kind and return its body."""
+    got, body = recv_frame(sock)
+    return expected(kind, got, body)
+
+
+# asyncio stream counterparts of the socket functions above
+
+async def write_json(writer, kind, obj):
+    writer.write(_json_frame(kind, obj))
+    await writer.drain()
+
+
+async def write_array(writer, kind, arr):
+    header, view = _array_frame(kind, arr)
+    writer.write(header)
+    for start in range(0, len(view), CHUNK_BYTES):
+        writer.write(view[start:start + CHUNK_BYTES])
+        await writer.drain()
+
+
+async def write_error(writer, message):
+    await write_json(writer, MSG_ERROR, {'error': message})
+
+
+async def _read_exactly(reader, n):
+    try:
+        return await reader.readexactly(n)
+    except asyncio.IncompleteReadError:
+        raise EOFError("Connection closed") from None
+
+
+async def read_frame(reader):
+    """Like recv_frame; array bodies are read-only views of the received bytes."""
+    kind, dtype, length = _parse_header(await _read_exactly(reader, HEADER.size))
+    body = await _read_exactly(reader, length)
+    if dtype is None:
+        return kind, json.loads(body)
+    return kind, np.frombuffer(body, dtype=dtype)
+
+
+async def read_expected(reader, kind):
+    got, body = await read_frame(reader)
+    return expected(kind, got, body)
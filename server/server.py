@@ -1,39 +1,177 @@
 import socket
 import threading
-import pickle
 import time
 import os
 import shutil
+from itertools import islice
+import numpy as np
 from pyspark.sql import SparkSession
-from pyspark.sql.functions import lit, split, trim
+from pyspark.sql.functions import coalesce, col, floor, lit, split, trim
 from pyspark.sql.types import StructType, StructField, StringType
 from prb_sketch import PRBSketch 
+from local_ingest import LocalIngestEngine
+from checkpoint import SketchCheckpointer, recover
+from subscription import QuerySubscription
+from heavy_hitters import DEFAULT_COUNTERS
+from windowed_sketch import WindowedSketch
+from metrics import REGISTRY, MetricsRegistry, serve_metrics
+from protocol import (
+    MSG_CONFIG, MSG_QUERIES, MSG_EDGE_WEIGHTS, MSG_REACHABILITY, MSG_STATS, MSG_TOP_K, MSG_METRICS,
+    expect_frame, expected, recv_frame, send_array, send_json, send_error
+)
+
+# Shipped to executors so partition sketches can be built and unpickled there
+SKETCH_MODULES = (
+    'hashing.py', 'hash_index.py', 'storage.py', 'snapshot.py', 'dsu.py', 'connectivity.py', 'heavy_hitters.py',
+    'metrics.py', 'kernels.py', 'prb_sketch.py'
+)
+
+
+_BATCH_SECONDS = REGISTRY.histogram('server_batch_seconds', "Time to process one streaming batch")
+_COLLECT_SECONDS = REGISTRY.histogram('server_batch_collect_seconds', "Time to sketch and collect a batch's partitions")
+_BATCH_EDGES = REGISTRY.counter('server_batch_edges_total', "Edges in processed streaming batches")
+_ROUND_SECONDS = REGISTRY.histogram('server_query_round_seconds', "Time to answer and send one round of results")
+
+
+def build_partition_sketch(rows, width, depth, conflict_limit, chunk_size, heavy_hitters=0, deletions=False):
+    """Build a sparse sketch from one partition's rows, chunk by chunk."""
+    sketch = PRBSketch(
+        width=width, depth=depth, conflict_limit=conflict_limit, storage='sparse',
+        heavy_hitters=heavy_hitters, deletions=deletions
+    )
+    count = 0
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        sketch.update(chunk)
+        count += len(chunk)
+    # The executor's metrics travel with the sketch to the driver
+    yield sketch, count, REGISTRY.drain()
+
+
+def merge_partition_sketches(left, right):
+    metrics = MetricsRegistry()
+    metrics.absorb(left[2])
+    metrics.absorb(right[2])
+    return left[0].merge(right[0]), left[1] + right[1], metrics.drain()
+
 
 class SparkSketchServer:
-    def __init__(self, host='localhost', port=9992):
+    def __init__(self, host='localhost', port=9992, metrics_port=None):
         self.host = host
         self.port = port
+        # Also serve the metrics as text over HTTP on this port
+        self.metrics_port = metrics_port
         self.clients = []
-        self.spark = SparkSession.builder \
-            .appName("PRBSketchServer") \
-            .config("spark.sql.streaming.forceDeleteTempCheckpointLocation", "true") \
-            .getOrCreate()
+        # Started on first use, so clients on the local engine never pay
+        # for the JVM
+        self.spark = None
         self.sketch = None
+        # Held while the sketch changes and while a round of answers is read
+        # from it, since ingest and run_query work on different threads
+        self.lock = threading.Lock()
         self.running = False
         self.query = None
 
+    def _spark_session(self):
+        if self.spark is None:
+            self.spark = SparkSession.builder \
+                .appName("PRBSketchServer") \
+                .config("spark.sql.streaming.forceDeleteTempCheckpointLocation", "true") \
+                .getOrCreate()
+            server_dir = os.path.dirname(os.path.abspath(__file__))
+            for module in SKETCH_MODULES:
+                self.spark.sparkContext.addPyFile(os.path.join(server_dir, module))
+        return self.spark
+
+    def _ingest_local(self, file_path, workers):
+        def report(shard, edge_count):
+            stats = self.sketch.get_stats()
+            print(f"Merged shard {shard} with {edge_count} edges")
+            print(f"  → Total Edges: {stats['total_edges']}")
+            print(f"  → Occupancy Rate: {stats['occupancy_rate']:.2%}")
+
+        engine = LocalIngestEngine(workers=workers)
+        total = engine.ingest(file_path, self.sketch, progress=report, lock=self.lock)
+        print(f"[SERVER] Local ingest of {file_path} finished: {total} edges")
+
     def handle_client(self, conn, addr):
         print(f"[SERVER] Connected to {addr}")
         temp_dir = None # <-- CORRECTED: Initialize temp_dir to None
+        query_thread = None
         
         try:
-            config = pickle.loads(conn.recv(4096))
-            width = config['width']
-            depth = config['depth']
-            conflict_limit = config['conflict_limit']
+            # The JSON config is followed by the query pairs as one int64
+            # frame, so a query set of millions of pairs arrives as one batch
+            kind, body = recv_frame(conn)
+            if kind == MSG_METRICS:
+                send_json(conn, MSG_METRICS, REGISTRY.snapshot())
+                return
+            config = expected(MSG_CONFIG, kind, body)
+            queries = expect_frame(conn, MSG_QUERIES).reshape(-1, 2)
             file_path = config['file_path']
-            queries = config['queries']
             batch_size = config.get('batch_size', 1000)
+            storage = config.get('storage', 'dense')
+            # 'spark' streams the file through Spark; 'local' shards it over
+            # a process pool on this machine; 'snapshot' serves a sketch
+            # saved with PRBSketch.save, in which case file_path points at it
+            engine = config.get('engine', 'spark')
+            save_path = config.get('save_snapshot')
+            # Push results only when a batch can have changed them, instead
+            # of resending everything every 2 seconds
+            subscribe = config.get('subscribe', False)
+            # Heaviest edges and nodes sent with every round of results
+            top_k = config.get('top_k', 0)
+            # Keep only the last `window` epochs instead of the whole stream.
+            # An epoch is `epoch_batches` Spark batches, or `epoch_seconds` of
+            # event time when timestamp_column names a (0-based) field holding
+            # a Unix timestamp; `decay` < 1 fades older epochs exponentially
+            window = config.get('window')
+            timestamp_column = config.get('timestamp_column')
+            # Read a signed weight from the third field, so negative weights
+            # delete edges and reachability follows the live edges only
+            deletions = config.get('deletions', False)
+
+            # Spark commits every batch's offsets once foreachBatch returns, so
+            # a batch sketched after the last checkpoint would never be replayed
+            if config.get('checkpoint_every', 1) != 1:
+                raise ValueError("checkpoint_every must be 1: Spark won't replay batches after the last checkpoint")
+
+            if window:
+                if engine != 'spark' or subscribe or config.get('checkpoint_dir') or deletions:
+                    raise ValueError("window needs the spark engine, without subscribe, checkpoint_dir or deletions")
+                if timestamp_column is None:
+                    epoch_length = config.get('epoch_batches', 1)
+                else:
+                    epoch_length = config.get('epoch_seconds', 60)
+                self.sketch = WindowedSketch(
+                    window,
+                    epoch_length=epoch_length,
+                    decay=config.get('decay', 1.0),
+                    width=config['width'],
+                    depth=config['depth'],
+                    conflict_limit=config['conflict_limit'],
+                    storage=storage,
+                    heavy_hitters=config.get('heavy_hitters', DEFAULT_COUNTERS if top_k else 0),
+                    deletions=deletions
+                )
+            elif engine == 'snapshot':
+                self.sketch = PRBSketch.load(file_path)
+            else:
+                self.sketch = PRBSketch(
+                    width=config['width'],
+                    depth=config['depth'],
+                    conflict_limit=config['conflict_limit'],
+                    storage=storage,
+                    heavy_hitters=config.get('heavy_hitters', DEFAULT_COUNTERS if top_k else 0),
+                    deletions=deletions
+                )
+            width = self.sketch.width
+            depth = self.sketch.depth
+            conflict_limit = self.sketch.conflict_limit
+            heavy_hitters = self.sketch.heavy_hitters
+            deletions = self.sketch.deletions
 
             print(f"[SERVER] Config received:")
             print(f"  → Width: {width}")
@@ -41,93 +179,203 @@ class SparkSketchServer:
             print(f"  → Conflict Limit: {conflict_limit}")
             print(f"  → File Path: {file_path}")
             print(f"  → Batch Size: {batch_size}")
-            print(f"  → Queries: {queries}")
+            print(f"  → Storage: {self.sketch.storage.name}")
+            print(f"  → Engine: {engine}")
+            print(f"  → Queries: {len(queries)} pairs")
+            print(f"  → Subscribe: {subscribe}")
+            if window:
+                print(f"  → Window: {window} epochs")
 
-            self.sketch = PRBSketch(
-                width=width,
-                depth=depth,
-                conflict_limit=conflict_limit
-            )
+            def send_results(weights, reachable):
+                with self.lock:
+                    top = self.sketch.heavy.report(top_k) if top_k and self.sketch.heavy else None
+                    stats = self.sketch.get_stats()
+                send_array(conn, MSG_EDGE_WEIGHTS, weights.astype(np.float32))
+                send_array(conn, MSG_REACHABILITY, reachable)
+                if top is not None:
+                    send_json(conn, MSG_TOP_K, top)
+                send_json(conn, MSG_STATS, stats)
+
+            def run_query():
+                self.running = True
+                sources, dests = queries[:, 0], queries[:, 1]
+                subscription = None
+                changed = threading.Event()
+                closed = threading.Event()
+
+                def watch_close():
+                    # Subscribers send nothing after their queries, and an
+                    # unchanged sketch never sends them anything, so only
+                    # the read returning at EOF notices they left
+                    try:
+                        while conn.recv(4096):
+                            pass
+                    except OSError:
+                        pass
+                    closed.set()
+                    changed.set()
+
+                try:
+                    if subscribe:
+                        with self.lock:
+                            subscription = QuerySubscription(self.sketch, sources, dests, on_dirty=changed.set)
+                        threading.Thread(target=watch_close, daemon=True).start()
+                        send_results(subscription.weights, subscription.reachable)
+                    while self.running:
+                        if subscription:
+                            # Woken by batches touching the queries' cells or
+                            # roots; the timeout only rechecks self.running
+                            if not changed.wait(timeout=2):
+                                continue
+                            if closed.is_set():
+                                print(f"Client {addr} disconnected.")
+                                break
+                            changed.clear()
+                            with _ROUND_SECONDS.time():
+                                with self.lock:
+                                    refreshed = subscription.refresh()
+                                if refreshed:
+                                    send_results(subscription.weights, subscription.reachable)
+                        else:
+                            if self.sketch:
+                                with _ROUND_SECONDS.time():
+                                    with self.lock:
+                                        weights = self.sketch.edge_query_many(sources, dests)
+                                        reachable = self.sketch.reachability_many(sources, dests)
+                                    send_results(weights, reachable)
+                            time.sleep(2)
+                except (ConnectionResetError, BrokenPipeError):
+                    print(f"Client {addr} disconnected.")
+                except Exception as e:
+                    print(f"Query error: {e}")
+                finally:
+                    if subscription:
+                        subscription.close()
+                self.running = False
+
+            query_thread = threading.Thread(target=run_query, daemon=True)
+
+            if engine in ('local', 'snapshot'):
+                query_thread.start()
+                if engine == 'local':
+                    self._ingest_local(file_path, config.get('workers'))
+                    if save_path:
+                        self.sketch.save(save_path)
+                        print(f"[SERVER] Sketch saved to {save_path}")
+                query_thread.join()
+                return
 
             temp_dir = "/tmp/sketch_stream"
             if os.path.exists(temp_dir):
                 shutil.rmtree(temp_dir)
             os.makedirs(temp_dir)
 
+            # Spark watches a directory, so expose the file there through a
+            # hard link instead of copying it; copy only across filesystems
             temp_file = os.path.join(temp_dir, "data.txt")
-            shutil.copy2(file_path, temp_file)
+            try:
+                os.link(file_path, temp_file)
+            except OSError:
+                shutil.copy2(file_path, temp_file)
+
+            # With a checkpoint directory, the sketch is rebuilt from its last
+            # committed checkpoint and Spark resumes the stream from its own
+            # offsets there; batches replayed by Spark that the sketch already
+            # holds are skipped
+            checkpointer = None
+            checkpoint_dir = config.get('checkpoint_dir')
+            if checkpoint_dir:
+                recovered, last_batch_id = recover(checkpoint_dir)
+                if recovered is not None:
+                    self.sketch = recovered
+                    print(f"[SERVER] Recovered sketch up to batch {last_batch_id} from {checkpoint_dir}")
+                checkpointer = SketchCheckpointer(checkpoint_dir, self.sketch, last_batch_id)
 
             schema = StructType([
                 StructField("value", StringType(), True)
             ])
 
             def process_batch(batch_df, batch_id):
+                if checkpointer and batch_id <= checkpointer.last_batch_id:
+                    return
                 if batch_df.count() == 0:
                     return
-                
+                started = time.perf_counter()
+
                 cleaned_df = batch_df.filter(~batch_df.value.startswith("#"))
-                edges_df = cleaned_df.select(
-                    split(trim(cleaned_df.value), "\t").getItem(0).alias("source"),
-                    split(trim(cleaned_df.value), "\t").getItem(1).alias("dest")
-                ).withColumn("weight", lit(1.0))
+                fields = split(trim(cleaned_df.value), "\t")
+                weight = coalesce(fields.getItem(2).cast("double"), lit(1.0)) if deletions else lit(1.0)
+                columns = [fields.getItem(0).alias("source"), fields.getItem(1).alias("dest"), weight.alias("weight")]
+                if window and timestamp_column is not None:
+                    columns.append(
+                        floor(fields.getItem(timestamp_column).cast("double") / epoch_length).alias("epoch")
+                    )
+                edges_df = cleaned_df.select(*columns)
 
-                edges_collected = edges_df.collect()
-                self.sketch.update(edges_collected)
+                def sketch_edges(df):
+                    # Each partition is sketched on its executor and the partial
+                    # sketches are merged tree-style before reaching the driver
+                    partials = df.rdd.mapPartitions(
+                        lambda rows: build_partition_sketch(
+                            rows, width, depth, conflict_limit, batch_size, heavy_hitters, deletions
+                        )
+                    )
+                    with _COLLECT_SECONDS.time():
+                        batch_sketch, count, metrics = partials.treeReduce(merge_partition_sketches)
+                    REGISTRY.absorb(metrics)
+                    return batch_sketch, count
+
+                if not window:
+                    batch_sketch, edge_count = sketch_edges(edges_df)
+                    with self.lock:
+                        self.sketch.merge(batch_sketch)
+                elif timestamp_column is None:
+                    batch_sketch, edge_count = sketch_edges(edges_df)
+                    with self.lock:
+                        self.sketch.merge(batch_sketch, at=batch_id)
+                else:
+                    # A batch may straddle epochs; sketch each one separately
+                    edge_count = 0
+                    epochs = sorted(row.epoch for row in edges_df.select("epoch").distinct().collect()
+                                    if row.epoch is not None)
+                    for epoch in epochs:
+                        epoch_df = edges_df.filter(col("epoch") == epoch).select("source", "dest", "weight")
+                        epoch_sketch, count = sketch_edges(epoch_df)
+                        with self.lock:
+                            self.sketch.merge(epoch_sketch, at=epoch * epoch_length)
+                        edge_count += count
+                if checkpointer:
+                    checkpointer.commit(batch_id)
+                _BATCH_SECONDS.observe(time.perf_counter() - started)
+                _BATCH_EDGES.inc(edge_count)
 
                 stats = self.sketch.get_stats()
-                print(f"Processed batch {batch_id} with {len(edges_collected)} edges")
+                print(f"Processed batch {batch_id} with {edge_count} edges")
                 print(f"  → Hash Functions: {stats['hash_functions']}")
                 print(f"  → Total Edges: {stats['total_edges']}")
                 print(f"  → Occupancy Rate: {stats['occupancy_rate']:.2%}")
 
-            stream_df = self.spark.readStream \
+            stream_df = self._spark_session().readStream \
                 .schema(schema) \
                 .option("maxFilesPerTrigger", 1) \
                 .text(temp_dir)
 
-            self.query = stream_df.writeStream \
-                .foreachBatch(process_batch) \
-                .start()
+            writer = stream_df.writeStream.foreachBatch(process_batch)
+            if checkpoint_dir:
+                writer = writer.option("checkpointLocation", os.path.join(checkpoint_dir, "stream"))
+            self.query = writer.start()
 
-            def run_query():
-                self.running = True
-                while self.running:
-                    try:
-                        results = []
-                        if self.sketch:
-                            for (src, dest) in queries:
-                                edge_weight = self.sketch.edge_query(src, dest)
-                                reachability = self.sketch.reachability_query(src, dest)
-                                results.append({
-                                    'query': (src, dest),
-                                    'edge_weight': edge_weight,
-                                    'reachability': reachability
-                                })
-
-                            stats = self.sketch.get_stats()
-                            results.append({
-                                'type': 'stats',
-                                'stats': stats
-                            })
-
-                            conn.sendall(pickle.dumps(results))
-                        time.sleep(2)
-                    except (ConnectionResetError, BrokenPipeError):
-                        print(f"Client {addr} disconnected.")
-                        break
-                    except Exception as e:
-                        print(f"Query error: {e}")
-                        break
-                self.running = False
-
-
-            query_thread = threading.Thread(target=run_query, daemon=True)
             query_thread.start()
-
             self.query.awaitTermination()
 
         except Exception as e:
             print(f"Client handling error: {e}")
+            # Only report to the client while no result frames are in flight
+            if query_thread is None or not query_thread.is_alive():
+                try:
+                    send_error(conn, str(e))
+                except OSError:
+                    pass
         finally:
             self.running = False
             if self.query and self.query.isActive:
@@ -143,6 +391,9 @@ class SparkSketchServer:
             s.bind((self.host, self.port))
             s.listen()
             print(f"[SERVER] PRB Sketch Server listening on {self.host}:{self.port}")
+            if self.metrics_port:
+                serve_metrics(self.metrics_port, self.host)
+                print(f"[SERVER] Metrics at http://{self.host}:{self.metrics_port}/metrics")
 
             while True:
                 conn, addr = s.accept()
@@ -159,7 +410,8 @@ class SparkSketchServer:
         self.running = False
         if self.query and self.query.isActive:
             self.query.stop()
-        self.spark.stop()
+        if self.spark:
+            self.spark.stop()
 
 if __name__ == "__main__":
     server = SparkSketchServer()
@@ -0,0 +1,81 @@
+import json
+import os
+import struct
+import numpy as np
+
+MAGIC = b'PRBSKTCH'
+VERSION = 1
+# magic, format version, length of the JSON header that follows
+PREAMBLE = struct.Struct('<8sII')
+ALIGN = 64
+
+
+def _aligned(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def write_snapshot(path, meta, arrays):
+    """
+    Write a snapshot: a fixed preamble, a JSON header holding `meta` and the
+    section table, then every array's raw bytes at a 64-byte aligned offset.
+    The file is written next to `path` and moved into place, so sketches
+    still mapped from an older snapshot at the same path stay valid.
+    """
+    arrays = {name: np.ascontiguousarray(arr) for name, arr in arrays.items()}
+    header = b''
+    # Offsets depend on the header length and vice versa; iterate until stable
+    while True:
+        offset = _aligned(PREAMBLE.size + len(header))
+        sections = []
+        for name, arr in arrays.items():
+            sections.append({
+                'name': name,
+                'dtype': arr.dtype.str,
+                'shape': list(arr.shape),
+                'offset': offset,
+            })
+            offset = _aligned(offset + arr.nbytes)
+        encoded = json.dumps({'meta': meta, 'sections': sections}).encode()
+        stable = len(encoded) == len(header)
+        header = encoded
+        if stable:
+            break
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(PREAMBLE.pack(MAGIC, VERSION, len(header)))
+        f.write(header)
+        for section in sections:
+            arr = arrays[section['name']]
+            f.write(b'\0' * (section['offset'] - f.tell()))
+            f.write(arr.data)
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path, mmap_mode='c'):
+    """
+    Open a snapshot and return (meta, arrays). Arrays are memory-mapped with
+    `mmap_mode` ('c' is copy-on-write: pages load lazily and writes stay
+    private to this process), or read into memory when mmap_mode is None.
+    """
+    with open(path, 'rb') as f:
+        magic, version, header_len = PREAMBLE.unpack(f.read(PREAMBLE.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a PRBSketch snapshot")
+        if version != VERSION:
+            raise ValueError(f"Unsupported snapshot version {version} (expected {VERSION})")
+        header = json.loads(f.read(header_len))
+
+    arrays = {}
+    for section in header['sections']:
+        dtype = np.dtype(section['dtype'])
+        shape = tuple(section['shape'])
+        if mmap_mode is None or 0 in shape:
+            with open(path, 'rb') as f:
+                f.seek(section['offset'])
+                count = int(np.prod(shape))
+                arr = np.fromfile(f, dtype=dtype, count=count).reshape(shape)
+        else:
+            arr = np.memmap(path, dtype=dtype, mode=mmap_mode, offset=section['offset'], shape=shape)
+        arrays[section['name']] = arr
+    return header['meta'], arrays
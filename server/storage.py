@@ -0,0 +1,119 @@
+import numpy as np
+from hash_index import HashIndex
+
+
+class DenseStorage:
+    """
+    Columnar cell store for the sketch matrix. Every (layer, x, y) cell is
+    addressed by the flat id (layer * width + x) * width + y and owns one
+    uint32 rank, one float32 weight and conflict_limit uint32 edge slots.
+
+    Ranks are stored complemented (max_rank - rank) and slots hold
+    edge id + 1, so an all-zero cell is an empty one. That lets the arrays
+    come straight from np.zeros, whose pages are only touched on first write.
+    """
+    name = 'dense'
+
+    def __init__(self, depth, width, conflict_limit):
+        cells = depth * width * width
+        self.rank_key = np.zeros(cells, dtype=np.uint32)
+        self.weight = np.zeros(cells, dtype=np.float32)
+        self.slots = np.zeros((cells, conflict_limit), dtype=np.uint32)
+
+    @property
+    def nbytes(self):
+        return self.rank_key.nbytes + self.weight.nbytes + self.slots.nbytes
+
+    def locate(self, cell_keys, create=False):
+        """Storage ids for flat cell keys; -1 marks cells that hold nothing."""
+        return np.asarray(cell_keys, dtype=np.int64)
+
+    def cell_keys(self, ids):
+        return np.asarray(ids, dtype=np.int64)
+
+    def occupied(self):
+        return np.flatnonzero(self.rank_key)
+
+    def to_arrays(self):
+        return {'rank_key': self.rank_key, 'weight': self.weight, 'slots': self.slots}
+
+    def restore(self, arrays):
+        self.rank_key = arrays['rank_key']
+        self.weight = arrays['weight']
+        self.slots = arrays['slots']
+
+
+class SparseStorage:
+    """
+    Cell store that only materializes occupied cells. Flat cell keys are
+    interned in an open-addressing HashIndex and the same rank/weight/slot
+    columns as DenseStorage are kept per interned cell, so memory follows
+    the number of occupied cells instead of depth * width^2.
+    """
+    name = 'sparse'
+
+    def __init__(self, depth, width, conflict_limit, capacity=1024):
+        self.index = HashIndex(key_width=1, capacity=capacity)
+        self.rank_key = np.zeros(capacity, dtype=np.uint32)
+        self.weight = np.zeros(capacity, dtype=np.float32)
+        self.slots = np.zeros((capacity, conflict_limit), dtype=np.uint32)
+
+    @property
+    def nbytes(self):
+        return self.index.nbytes + self.rank_key.nbytes + self.weight.nbytes + self.slots.nbytes
+
+    def _grow(self, size):
+        capacity = len(self.rank_key)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        rank_key = np.zeros(capacity, dtype=np.uint32)
+        weight = np.zeros(capacity, dtype=np.float32)
+        slots = np.zeros((capacity, self.slots.shape[1]), dtype=np.uint32)
+        used = len(self.rank_key)
+        rank_key[:used] = self.rank_key
+        weight[:used] = self.weight
+        slots[:used] = self.slots
+        self.rank_key, self.weight, self.slots = rank_key, weight, slots
+
+    def locate(self, cell_keys, create=False):
+        cell_keys = np.asarray(cell_keys, dtype=np.int64)
+        if not create:
+            return self.index.lookup(cell_keys.ravel()).reshape(cell_keys.shape)
+        # The columns grow before a concurrent lookup can see the new ids
+        return self.index.intern(cell_keys.ravel(), reserve=self._grow).reshape(cell_keys.shape)
+
+    def cell_keys(self, ids):
+        return self.index.keys()[ids, 0]
+
+    def occupied(self):
+        return np.flatnonzero(self.rank_key[:self.index.size])
+
+    def to_arrays(self):
+        arrays = {'rank_key': self.rank_key, 'weight': self.weight, 'slots': self.slots}
+        for name, arr in self.index.to_arrays().items():
+            arrays[f'index.{name}'] = arr
+        return arrays
+
+    def restore(self, arrays):
+        self.rank_key = arrays['rank_key']
+        self.weight = arrays['weight']
+        self.slots = arrays['slots']
+        self.index = HashIndex.from_arrays({
+            name[len('index.'):]: arr for name, arr in arrays.items() if name.startswith('index.')
+        })
+
+
+STORAGE_BACKENDS = {
+    DenseStorage.name: DenseStorage,
+    SparseStorage.name: SparseStorage,
+}
+
+
+def make_storage(backend, depth, width, conflict_limit):
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(
+            f"Unknown storage backend {backend!r}; expected one of {sorted(STORAGE_BACKENDS)}"
+        )
+    return STORAGE_BACKENDS[backend](depth, width, conflict_limit)
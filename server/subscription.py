@@ -0,0 +1,108 @@
+import threading
+import numpy as np
+from hashing import as_node_ids
+
+
+def _expand_ranges(lo, hi):
+    """Concatenation of range(lo[i], hi[i]) over every i."""
+    lengths = hi - lo
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    starts = np.repeat(lo - np.cumsum(lengths) + lengths, lengths)
+    return starts + np.arange(total)
+
+
+class QuerySubscription:
+    """
+    A registered set of (source, dest) queries whose answers are refreshed
+    only when the sketch changes in a way that can affect them.
+
+    Every query depends on its `depth` cells and on the DSU roots of its
+    two endpoints. The subscription listens to the sketch: a written cell is
+    matched against the sorted cell keys of all queries, and a re-linked DSU
+    node against the endpoints and their current roots, marking just those
+    queries (or the reachability answers) dirty. refresh() recomputes what is dirty
+    and reports whether any answer actually changed. on_dirty, if given, is
+    called from the listener whenever something was marked.
+    """
+    def __init__(self, sketch, sources, dests, on_dirty=None):
+        self.sketch = sketch
+        self.sources = as_node_ids(sources)
+        self.dests = as_node_ids(dests)
+        self.on_dirty = on_dirty
+        n = len(self.sources)
+
+        xs, ys, _ = sketch.hash_batch(self.sources, self.dests)
+        keys = sketch._cell_keys(xs, ys).ravel()
+        order = np.argsort(keys, kind='stable')
+        self._keys = keys[order]
+        # keys are laid out layer by layer, so position % n is the query
+        self._queries = order % max(n, 1)
+
+        self._lock = threading.Lock()
+        self._dirty = []
+        self._relink = False
+        self.weights = sketch.edge_query_many(self.sources, self.dests)
+        self.reachable = sketch.reachability_many(self.sources, self.dests)
+        self._track_roots()
+        sketch.add_listener(self._on_change)
+
+    def close(self):
+        self.sketch.remove_listener(self._on_change)
+
+    def _track_roots(self):
+        dsu = self.sketch.dsu
+        endpoints = np.unique(np.concatenate([self.sources, self.dests]))
+        idx = dsu.lookup(endpoints)
+        known = idx >= 0
+        # With deletions, a split relabels the endpoints themselves
+        self._roots = np.unique(np.concatenate([dsu.find(idx[known]), idx[known]]))
+        self._unseen = endpoints[~known]
+
+    def _on_change(self, cells, nodes):
+        keys = self.sketch.storage.cell_keys(cells)
+        lo = np.searchsorted(self._keys, keys, side='left')
+        hi = np.searchsorted(self._keys, keys, side='right')
+        hit = self._queries[_expand_ranges(lo, hi)]
+
+        # A tracked endpoint or root that changed, or an endpoint seen for
+        # the first time, can change reachability answers
+        nodes = np.asarray(nodes, dtype=np.int64)
+        relink = bool(len(nodes)) and (
+            np.isin(nodes, self._roots).any()
+            or np.isin(self.sketch.dsu.node_ids(nodes), self._unseen).any()
+        )
+        if len(hit) == 0 and not relink:
+            return
+        with self._lock:
+            if len(hit):
+                self._dirty.append(hit)
+            self._relink |= relink
+        if self.on_dirty:
+            self.on_dirty()
+
+    @property
+    def dirty(self):
+        return bool(self._dirty) or self._relink
+
+    def refresh(self):
+        """
+        Recompute the answers marked dirty since the last refresh. Returns
+        True when any edge weight or reachability answer changed.
+        """
+        with self._lock:
+            dirty, self._dirty = self._dirty, []
+            relink, self._relink = self._relink, False
+        changed = False
+        if dirty:
+            queries = np.unique(np.concatenate(dirty))
+            weights = self.sketch.edge_query_many(self.sources[queries], self.dests[queries])
+            changed |= not np.array_equal(weights, self.weights[queries])
+            self.weights[queries] = weights
+        if relink:
+            reachable = self.sketch.reachability_many(self.sources, self.dests)
+            changed |= not np.array_equal(reachable, self.reachable)
+            self.reachable = reachable
+            self._track_roots()
+        return changed
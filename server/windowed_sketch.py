@@ -0,0 +1,213 @@
+from collections import deque
+import numpy as np
+from hashing import as_node_ids
+from prb_sketch import PRBSketch
+from dsu import ArrayDSU
+from heavy_hitters import HeavyHitters, SpaceSaving
+
+
+class WindowedSketch:
+    """
+    A sliding window over an edge stream, kept as a ring of per-epoch
+    PRBSketch instances, oldest first.
+
+    Edges are placed by position: a Spark batch_id or an event timestamp,
+    cut into epochs of `epoch_length`. Only the last `window` epochs are
+    kept, so memory stays at `window` sketches however long the stream
+    runs, and expiring the oldest epoch is a popleft. Queries combine the
+    live epochs: edge and node weights are summed, scaled by
+    decay ** (age in epochs) for an exponentially decayed window, and
+    reachability is over the union of the epochs' edges.
+
+    Remaining keyword arguments are passed to every epoch's PRBSketch,
+    which can't take deletions.
+    """
+    def __init__(self, window, epoch_length=1, decay=1.0, **params):
+        if window < 1:
+            raise ValueError("window must be at least 1 epoch")
+        if epoch_length <= 0:
+            raise ValueError("epoch_length must be positive")
+        if not 0 < decay <= 1:
+            raise ValueError("decay must be in (0, 1]")
+        # A deletion lands in the current epoch, apart from the earlier epoch
+        # holding the insertion it should cancel
+        if params.get('deletions'):
+            raise ValueError("deletions are not supported in a windowed sketch")
+        self.window = window
+        self.epoch_length = epoch_length
+        self.decay = decay
+        self.params = params
+        self.epochs = deque([(0, PRBSketch(**params))])
+        self._dsu = None
+
+    @property
+    def current(self):
+        """The newest epoch's sketch; its parameters are every epoch's."""
+        return self.epochs[-1][1]
+
+    @property
+    def width(self):
+        return self.current.width
+
+    @property
+    def depth(self):
+        return self.current.depth
+
+    @property
+    def conflict_limit(self):
+        return self.current.conflict_limit
+
+    @property
+    def storage(self):
+        return self.current.storage
+
+    @property
+    def heavy_hitters(self):
+        return self.current.heavy_hitters
+
+    @property
+    def deletions(self):
+        return self.current.deletions
+
+    def epoch_of(self, position):
+        return int(position // self.epoch_length)
+
+    def _sketch_for(self, epoch):
+        """The sketch holding `epoch`, opening it if needed; None once expired."""
+        newest = self.epochs[-1][0]
+        if epoch > newest:
+            self.epochs.append((epoch, PRBSketch(**self.params)))
+            while self.epochs[0][0] <= epoch - self.window:
+                self.epochs.popleft()
+            self._dsu = None
+            return self.epochs[-1][1]
+        if epoch <= newest - self.window:
+            return None
+        # Late data for an epoch still in the window
+        for index in range(len(self.epochs) - 1, -1, -1):
+            held, sketch = self.epochs[index]
+            if held == epoch:
+                return sketch
+            if held < epoch:
+                self.epochs.insert(index + 1, (epoch, PRBSketch(**self.params)))
+                return self.epochs[index + 1][1]
+        self.epochs.appendleft((epoch, PRBSketch(**self.params)))
+        return self.epochs[0][1]
+
+    def advance(self, position):
+        """Move the window so it ends at position, expiring older epochs."""
+        self._sketch_for(self.epoch_of(position))
+
+    def update_batch(self, sources, dests, weights=None, at=None):
+        """
+        Add a batch of edges. `at` is one position for the whole batch, an
+        array with one position (e.g. timestamp) per edge, or None for the
+        newest epoch. Edges whose epoch already expired are dropped.
+        """
+        sources = as_node_ids(sources)
+        dests = as_node_ids(dests)
+        weights = np.ones(len(sources)) if weights is None else np.asarray(weights, dtype=np.float64)
+        if at is None or np.ndim(at) == 0:
+            epoch = self.epochs[-1][0] if at is None else self.epoch_of(at)
+            groups = [(epoch, slice(None))]
+        else:
+            epochs = np.asarray(at) // self.epoch_length
+            groups = [(int(epoch), epochs == epoch) for epoch in np.unique(epochs)]
+        for epoch, rows in groups:
+            sketch = self._sketch_for(epoch)
+            if sketch is not None:
+                sketch.update_batch(sources[rows], dests[rows], weights[rows])
+        self._dsu = None
+
+    def merge(self, other, at=None):
+        """Merge a PRBSketch into the epoch of position `at` (newest by default)."""
+        epoch = self.epochs[-1][0] if at is None else self.epoch_of(at)
+        sketch = self._sketch_for(epoch)
+        if sketch is not None:
+            sketch.merge(other)
+        self._dsu = None
+        return self
+
+    def _factors(self):
+        newest = self.epochs[-1][0]
+        return [(self.decay ** (newest - epoch), sketch) for epoch, sketch in self.epochs]
+
+    def edge_query(self, source, dest):
+        return float(self.edge_query_many([source], [dest])[0])
+
+    def edge_query_many(self, sources, dests):
+        total = np.zeros(len(as_node_ids(sources)))
+        for factor, sketch in self._factors():
+            total += factor * sketch.edge_query_many(sources, dests)
+        return total
+
+    def reachability_query(self, source, dest):
+        return bool(self.reachability_many([source], [dest])[0])
+
+    def reachability_many(self, sources, dests):
+        # Union the epochs' forests once per change of the window
+        if self._dsu is None:
+            dsu = ArrayDSU()
+            for _, sketch in self.epochs:
+                nodes = np.arange(len(sketch.dsu))
+                dsu.union_many(sketch.dsu.node_ids(nodes), sketch.dsu.node_ids(sketch.dsu.find(nodes)))
+            self._dsu = dsu
+        return self._dsu.connected(sources, dests)
+
+    def _neighbours(self, node, outgoing):
+        found, weights = [], []
+        for factor, sketch in self._factors():
+            others, w = sketch.successors(node) if outgoing else sketch.precursors(node)
+            found.append(others)
+            weights.append(factor * w)
+        others, inverse = np.unique(np.concatenate(found), return_inverse=True)
+        return others, np.bincount(inverse, weights=np.concatenate(weights), minlength=len(others))
+
+    def successors(self, node):
+        return self._neighbours(node, outgoing=True)
+
+    def precursors(self, node):
+        return self._neighbours(node, outgoing=False)
+
+    def node_out_weight(self, node):
+        return float(self.successors(node)[1].sum())
+
+    def node_in_weight(self, node):
+        return float(self.precursors(node)[1].sum())
+
+    @property
+    def heavy(self):
+        """Heavy hitters of the whole window, merged from the epochs on demand."""
+        capacity = self.current.heavy_hitters
+        if not capacity:
+            return None
+        merged = HeavyHitters(capacity)
+        for factor, sketch in self._factors():
+            scaled = HeavyHitters(capacity)
+            for kind, summary in sketch.heavy.summaries.items():
+                arrays = summary.to_arrays()
+                arrays['counts'] = arrays['counts'] * factor
+                arrays['errors'] = arrays['errors'] * factor
+                scaled.summaries[kind] = SpaceSaving.from_arrays(arrays, capacity)
+            merged.merge(scaled)
+        return merged
+
+    def top_k(self, kind='edges', k=10):
+        heavy = self.heavy
+        if heavy is None:
+            raise ValueError("Heavy hitter tracking is off; build the sketch with heavy_hitters > 0")
+        return heavy.top_k(kind, k)
+
+    def get_stats(self):
+        stats = [sketch.get_stats() for _, sketch in self.epochs]
+        occupied_cells = sum(s['occupied_cells'] for s in stats)
+        total_cells = sum(s['total_cells'] for s in stats)
+        return {
+            'hash_functions': self.depth,
+            'total_edges': sum(s['total_edges'] for s in stats),
+            'total_weight': sum(s['total_weight'] for s in stats),
+            'occupied_cells': occupied_cells,
+            'total_cells': total_cells,
+            'occupancy_rate': occupied_cells / total_cells if total_cells > 0 else 0,
+            'epochs': len(stats),
+        }